@@ -0,0 +1,151 @@
+"""
+Optional approximate indexes over the product embeddings.
+
+Brute-force ranking is a single matrix product and stays faster for small
+catalogs, so an index is only built once the catalog reaches
+ANN_MIN_PRODUCTS. With FAISS installed that is an HNSW graph; without it,
+catalogs with enough categories get a NumPy category-centroid prefilter,
+and anything else uses the exact path.
+"""
+
+import os
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from kernels import topk_filter
+from product_store import save_atomic
+
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+ANN_MIN_PRODUCTS = int(os.getenv("ANN_MIN_PRODUCTS", "5000"))
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "128"))
+
+# Categories scanned per query by the centroid prefilter
+CENTROID_PROBES = int(os.getenv("CENTROID_PROBES", "8"))
+
+INDEX_FILE = "hnsw.faiss"
+ROWS_FILE = "hnsw_rows.npy"
+
+
+class ANNIndex:
+    """HNSW index over the usable rows of a ProductStore embedding matrix"""
+
+    def __init__(self, index, rows: np.ndarray):
+        self.index = index
+        # FAISS ids -> store rows (rows without an embedding are left out)
+        self.rows = rows
+        self.index.hnsw.efSearch = HNSW_EF_SEARCH
+
+    def search(self, queries: np.ndarray, ks, thrs) -> List[tuple]:
+        """Approximate topk_filter_batch: (rows, scores) per query, descending"""
+        # Over-fetch so the similarity threshold can still leave k results
+        fetch = min(max(ks) * 2, self.index.ntotal)
+        sims, ids = self.index.search(np.ascontiguousarray(queries, dtype=np.float32), fetch)
+
+        results = []
+        for sim, found, k, thr in zip(sims, ids, ks, thrs):
+            # Same 0-1 mapping as calculate_enhanced_similarity
+            scores = np.clip((sim + 1.0) / 2.0, 0.0, 1.0).astype(np.float32)
+            keep = (found >= 0) & (scores >= thr)
+            results.append((self.rows[found[keep]][:k], scores[keep][:k]))
+        return results
+
+    def __str__(self):
+        return f"HNSW index over {self.index.ntotal} embeddings"
+
+
+class CentroidIndex:
+    """Scans only the categories whose mean embedding is closest to the query
+
+    A query's mean similarity to a set of unit vectors is its dot product
+    with their mean, so one product per category ranks the categories before
+    any product is scored.
+    """
+
+    def __init__(self, emb: np.ndarray, categories: np.ndarray, probes: int = CENTROID_PROBES):
+        usable = np.flatnonzero(~np.isnan(emb[:, 0]))
+        _, labels = np.unique(np.asarray(categories)[usable], return_inverse=True)
+        order = np.argsort(labels, kind="stable")
+
+        self.emb = emb
+        self.probes = probes
+        # Usable rows grouped by category (ascending within each), and where
+        # each category's rows start and end
+        self.rows = usable[order].astype(np.int64)
+        self.offsets = np.searchsorted(labels[order], np.arange(labels.max() + 2))
+        sums = np.add.reduceat(emb[self.rows].astype(np.float64), self.offsets[:-1])
+        self.centroids = (sums / np.diff(self.offsets)[:, None]).astype(np.float32)
+
+    def search(self, queries: np.ndarray, ks, thrs) -> List[tuple]:
+        """Approximate topk_filter_batch: (rows, scores) per query, descending"""
+        queries = np.asarray(queries, dtype=np.float32)
+        nearest = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :self.probes]
+
+        results = []
+        for query, categories, k, thr in zip(queries, nearest, ks, thrs):
+            # Ascending rows, so ties still favour lower rows as in exact search
+            candidates = np.sort(np.concatenate([
+                self.rows[self.offsets[c]:self.offsets[c + 1]] for c in categories
+            ]))
+            found, scores = topk_filter(self.emb[candidates], query, k, thr)
+            results.append((candidates[found], scores))
+        return results
+
+    def __str__(self):
+        return f"category centroid prefilter over {len(self.centroids)} categories"
+
+
+def build_index(emb: np.ndarray) -> ANNIndex:
+    usable = np.flatnonzero(~np.isnan(emb[:, 0]))
+    # Embeddings are unit length, so inner product is the similarity itself
+    index = faiss.IndexHNSWFlat(emb.shape[1], HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    index.add(np.ascontiguousarray(emb[usable], dtype=np.float32))
+    return ANNIndex(index, usable.astype(np.int64))
+
+
+def load_ann_index(emb: np.ndarray, cache_dir=None, categories=None):
+    """Build (or load from cache_dir) an index for emb, or None when brute force is preferable
+
+    categories (one per row) enables the centroid prefilter when FAISS is
+    not installed.
+    """
+    if len(emb) < ANN_MIN_PRODUCTS:
+        return None
+
+    if not FAISS_AVAILABLE:
+        # Only worth it when the probed categories leave some out
+        if categories is not None and len(np.unique(categories)) > CENTROID_PROBES:
+            return CentroidIndex(emb, categories)
+        return None
+
+    if cache_dir is not None:
+        cache_dir = Path(cache_dir)
+        index_path = cache_dir / INDEX_FILE
+        rows_path = cache_dir / ROWS_FILE
+        emb_path = cache_dir / "emb.npy"
+
+        if (index_path.exists() and rows_path.exists() and emb_path.exists()
+                and index_path.stat().st_mtime >= emb_path.stat().st_mtime):
+            return ANNIndex(faiss.read_index(str(index_path)), np.load(rows_path))
+
+    ann = build_index(emb)
+
+    if cache_dir is not None:
+        try:
+            save_atomic(rows_path, ann.rows)
+            tmp_path = index_path.with_name(f"{INDEX_FILE}.{os.getpid()}.tmp")
+            faiss.write_index(ann.index, str(tmp_path))
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            print(f"Could not write ANN index {index_path}: {e}")
+
+    return ann
@@ -0,0 +1,62 @@
+"""
+Out-of-process query feature extraction.
+
+PIL's decode and resample and the per-pixel scan (the nogil _scan_image
+kernel) release the GIL, but the Python-level feature code around them does
+not, so extractions on the embedding threads still take turns for part of
+each query. With EMBED_PROCESSES > 0 queries are embedded in a pool of worker
+processes instead, which isolates both the scan and the code around it.
+Workers import only similarity.py, so they stay small.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Optional, Union
+
+import numpy as np
+
+from similarity import generate_query_embedding, warm_up_feature_kernels
+
+
+def _ping() -> bool:
+    # Compile the feature kernels before the first request reaches this worker
+    warm_up_feature_kernels()
+    return True
+
+
+class EmbedWorkerPool:
+    """Runs generate_query_embedding in worker processes, or inline when disabled"""
+
+    def __init__(self, processes: int = 0):
+        self.processes = processes
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        if self.processes <= 0:
+            return
+        # spawn: never fork a process that already has OpenMP / event loop threads
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        # Start every worker now rather than on the first requests
+        for future in [self._pool.submit(_ping) for _ in range(self.processes)]:
+            future.result()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def embed(self, image_data: Union[bytes, BinaryIO]) -> np.ndarray:
+        """Blocking; call from a thread (e.g. the embedding executor)
+
+        Raises if the image can't be decoded or its features extracted.
+        """
+        if self._pool is None:
+            return generate_query_embedding(image_data, strict=True)
+
+        # File objects can't cross the process boundary
+        if not isinstance(image_data, (bytes, bytearray)):
+            image_data = image_data.read()
+        return self._pool.submit(generate_query_embedding, image_data, True).result()
@@ -0,0 +1,136 @@
+"""
+Caches for query embeddings and search results.
+
+QueryEmbeddingCache is an LRU keyed by a blake2b digest of the image bytes,
+so repeated uploads of the same image skip feature extraction entirely.
+
+SemanticResultCache keeps a small ring buffer of recent (normalized) query
+embeddings with their result lists and reuses a result list when a new query
+is close enough. The 50-d visual features are tightly clustered (most
+products have a *different* product above 0.99 cosine), so this tier is
+disabled unless SEMANTIC_CACHE_THRESHOLD is set.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, BinaryIO, Callable, Dict, Hashable, List, Optional, Union
+
+import numpy as np
+
+
+def image_hasher():
+    """Incremental hasher producing the same keys as image_key"""
+    return hashlib.blake2b(digest_size=16)
+
+
+def image_key(image_data: bytes) -> bytes:
+    """Content hash used as the cache key for an image"""
+    hasher = image_hasher()
+    hasher.update(image_data)
+    return hasher.digest()
+
+
+class QueryEmbeddingCache:
+    """Thread-safe LRU of image hash -> query embedding"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[bytes, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key: bytes, image_data: Union[bytes, BinaryIO],
+                       compute: Callable[[Union[bytes, BinaryIO]], Any]):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        embedding = compute(image_data)
+
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+        return embedding
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+
+class SemanticResultCache:
+    """Ring buffer of recent queries whose result lists can be reused"""
+
+    def __init__(self, threshold: Optional[float] = None, capacity: int = 64, dimension: int = 50):
+        self.threshold = threshold
+        self.capacity = capacity
+        self._queries = np.zeros((capacity, dimension), dtype=np.float32)
+        self._params: List[Optional[Hashable]] = [None] * capacity
+        self._results: List[Optional[list]] = [None] * capacity
+        self._next = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold is not None
+
+    def lookup(self, query: np.ndarray, params: Hashable) -> Optional[list]:
+        """Return cached results for a unit-length query, or None on a miss"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            # Unused slots are all-zero and score 0
+            similarities = self._queries @ query
+            for slot in np.argsort(-similarities):
+                if similarities[slot] < self.threshold:
+                    break
+                if self._params[slot] == params:
+                    self.hits += 1
+                    return self._results[slot]
+            self.misses += 1
+            return None
+
+    def store(self, query: np.ndarray, params: Hashable, results: list):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            slot = self._next
+            self._queries[slot] = query
+            self._params[slot] = params
+            self._results[slot] = results
+            self._next = (slot + 1) % self.capacity
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "capacity": self.capacity,
+        }
+
+
+_threshold = os.getenv("SEMANTIC_CACHE_THRESHOLD")
+
+# Global instances
+query_cache = QueryEmbeddingCache(maxsize=int(os.getenv("QUERY_CACHE_SIZE", "1024")))
+result_cache = SemanticResultCache(
+    threshold=float(_threshold) if _threshold else None,
+    capacity=int(os.getenv("SEMANTIC_CACHE_SIZE", "64")),
+)
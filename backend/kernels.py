@@ -0,0 +1,204 @@
+"""
+Optional Numba kernels for the search hot path.
+
+Numba is not a hard dependency (it adds LLVM to the image): when it is not
+installed every kernel falls back to an equivalent NumPy implementation.
+"""
+
+import os
+
+import numpy as np
+
+# Prefer OpenMP: the TBB layer can hang at interpreter exit when the first
+# parallel kernel runs on a worker thread rather than the main thread
+os.environ.setdefault("NUMBA_THREADING_LAYER_PRIORITY", "omp tbb workqueue")
+
+try:
+    import numba
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import simsimd
+    SIMSIMD_AVAILABLE = True
+except ImportError:
+    SIMSIMD_AVAILABLE = False
+
+# SimSIMD is opt-in: at 50 dimensions NumPy's BLAS matmul was faster on the
+# hardware we measured, but AVX-512 FP16 / SVE machines may differ
+USE_SIMSIMD = SIMSIMD_AVAILABLE and os.getenv("USE_SIMSIMD", "").lower() in ("1", "true", "yes")
+
+# fastmath without the no-NaN assumption: rows without an embedding are NaN
+FASTMATH_FLAGS = {"contract", "reassoc", "arcp", "nsz"}
+
+
+def quantize_int8(x: np.ndarray):
+    """Symmetric per-row int8 quantization
+
+    Returns (q, scale) with x ~= q * scale[:, None]. Rows containing NaN get a
+    NaN scale so they still score NaN and are never returned.
+    """
+    x = np.array(x, dtype=np.float32, ndmin=2)
+    missing = np.isnan(x).any(axis=1)
+    x = np.nan_to_num(x)
+
+    absmax = np.abs(x).max(axis=1)
+    scale = absmax / 127.0
+    q = np.zeros(x.shape, dtype=np.int8)
+    nonzero = absmax > 0
+    q[nonzero] = np.round(x[nonzero] / scale[nonzero, None])
+
+    scale[missing] = np.nan
+    return q, scale.astype(np.float32)
+
+
+def _dot_numpy(emb, queries, row_scale):
+    """emb @ queries.T, dequantizing when emb is int8 (row_scale given)"""
+    if row_scale is None:
+        if USE_SIMSIMD:
+            return np.asarray(simsimd.cdist(queries, emb, metric="dot"), dtype=np.float32).T
+        return emb @ queries.T
+
+    q, q_scale = quantize_int8(queries)
+    if USE_SIMSIMD:
+        # Native int8 dot products
+        scores = np.asarray(simsimd.cdist(q, emb, metric="dot"), dtype=np.float32).T
+    else:
+        # int8 products summed in float32 are exact well past 512 dimensions
+        scores = emb.astype(np.float32) @ q.T.astype(np.float32)
+    scores *= row_scale[:, None]
+    scores *= q_scale
+    return scores
+
+
+def _select_topk(scores, k, thr):
+    """Top-k of raw dot products, in place on scores"""
+    # Same 0-1 mapping as calculate_enhanced_similarity
+    np.clip((scores + 1.0) / 2.0, 0.0, 1.0, out=scores)
+
+    candidates = np.flatnonzero(scores >= thr)
+    if len(candidates) > k:
+        top = np.argpartition(-scores[candidates], k - 1)[:k]
+        candidates = np.sort(candidates[top])
+
+    candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+    return candidates, scores[candidates]
+
+
+def _topk_filter_numpy(emb, q, k, thr, row_scale=None):
+    return _select_topk(np.ascontiguousarray(_dot_numpy(emb, q[None, :], row_scale)[:, 0]), k, thr)
+
+
+if NUMBA_AVAILABLE:
+
+    @njit(cache=True, inline="always")
+    def _insert(top_rows, top_scores, count, k, row, score):
+        """Insert into a descending top-k list, keeping earlier rows first on ties"""
+        if count < k:
+            pos = count
+            count += 1
+        elif score > top_scores[k - 1]:
+            pos = k - 1
+        else:
+            return count
+
+        while pos > 0 and top_scores[pos - 1] < score:
+            top_scores[pos] = top_scores[pos - 1]
+            top_rows[pos] = top_rows[pos - 1]
+            pos -= 1
+        top_scores[pos] = score
+        top_rows[pos] = row
+        return count
+
+    @njit(cache=True, parallel=True, fastmath=FASTMATH_FLAGS)
+    def _topk_filter_numba(emb, q, k, thr, n_chunks, row_scale, q_scale):
+        n, d = emb.shape
+        chunk = (n + n_chunks - 1) // n_chunks
+
+        chunk_rows = np.empty((n_chunks, k), dtype=np.int64)
+        chunk_scores = np.empty((n_chunks, k), dtype=np.float32)
+        chunk_counts = np.zeros(n_chunks, dtype=np.int64)
+
+        # Each chunk streams over its rows keeping a private top-k list
+        for c in prange(n_chunks):
+            count = 0
+            for i in range(c * chunk, min((c + 1) * chunk, n)):
+                if row_scale is None:
+                    dot = 0.0
+                    for j in range(d):
+                        dot += emb[i, j] * q[j]
+                else:
+                    # int8 matrix: integer multiply-accumulate, then dequantize
+                    acc = np.int32(0)
+                    for j in range(d):
+                        acc += np.int32(emb[i, j]) * np.int32(q[j])
+                    dot = acc * (row_scale[i] * q_scale)
+                if dot != dot:
+                    continue
+                score = min(max((dot + 1.0) * 0.5, 0.0), 1.0)
+                if score >= thr:
+                    count = _insert(chunk_rows[c], chunk_scores[c], count, k, i, score)
+            chunk_counts[c] = count
+
+        # Merge in chunk order so ties still favour lower rows
+        top_rows = np.empty(k, dtype=np.int64)
+        top_scores = np.empty(k, dtype=np.float32)
+        count = 0
+        for c in range(n_chunks):
+            for i in range(chunk_counts[c]):
+                count = _insert(top_rows, top_scores, count, k, chunk_rows[c, i], chunk_scores[c, i])
+
+        return top_rows[:count], top_scores[:count]
+
+
+def topk_filter(emb: np.ndarray, q: np.ndarray, k: int, thr: float, row_scale=None):
+    """Top-k rows of emb by similarity to q, dropping scores below thr
+
+    Returns (rows, scores) sorted by descending score. Scores use the 0-1
+    mapping of calculate_enhanced_similarity. When row_scale is given, emb is
+    an int8 matrix from quantize_int8 and q is quantized the same way.
+    """
+    if k <= 0 or len(emb) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    if NUMBA_AVAILABLE:
+        n_chunks = max(1, min(numba.get_num_threads(), len(emb) // 1024 or 1))
+        if row_scale is None:
+            return _topk_filter_numba(emb, q.astype(np.float32), k, np.float32(thr),
+                                      n_chunks, None, np.float32(1.0))
+        q8, q_scale = quantize_int8(q)
+        return _topk_filter_numba(emb, q8[0], k, np.float32(thr),
+                                  n_chunks, row_scale, q_scale[0])
+
+    return _topk_filter_numpy(emb, q, k, thr, row_scale)
+
+
+def topk_filter_batch(emb: np.ndarray, queries: np.ndarray, ks, thrs, row_scale=None):
+    """topk_filter for several queries sharing a single matrix product
+
+    queries is (B, D); ks and thrs give each query's k and threshold.
+    Returns a list of (rows, scores) pairs in query order.
+    """
+    empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+    if len(emb) == 0:
+        return [empty] * len(queries)
+
+    if len(queries) == 1:
+        return [topk_filter(emb, queries[0], ks[0], thrs[0], row_scale)]
+
+    scores = np.ascontiguousarray(_dot_numpy(emb, queries.astype(np.float32), row_scale).T)
+    return [
+        _select_topk(scores[b], k, thr) if k > 0 else empty
+        for b, (k, thr) in enumerate(zip(ks, thrs))
+    ]
+
+
+def warm_up(dimension: int = 50):
+    """Compile the kernels up front so the first request doesn't pay for it"""
+    emb = np.zeros((1, dimension), dtype=np.float32)
+    topk_filter(emb, np.zeros(dimension, dtype=np.float32), 1, 0.0)
+
+    emb_q8, scale = quantize_int8(emb)
+    topk_filter(emb_q8, np.zeros(dimension, dtype=np.float32), 1, 0.0, scale)
@@ -1,13 +1,16 @@
+import asyncio
 import os
 import sys
-import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 import httpx
+import numpy as np
+import orjson
 from pathlib import Path
-from typing import Optional, Dict, Any
 from fastapi import FastAPI, File, UploadFile, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse, JSONResponse, Response
 from dotenv import load_dotenv
 
 from models import (
@@ -15,11 +18,16 @@ from models import (
     SearchResponse, 
     HealthResponse, 
     ErrorResponse,
-    SearchMethod,
-    ProductResult
+    SearchMethod
 )
-from similarity import generate_query_embedding, find_similar_products, get_category_stats
+from similarity import normalize_embeddings, warm_up_feature_kernels
 from pinecone_service import pinecone_service
+from product_store import cache_dir_for, load_product_store
+from ann_index import load_ann_index
+from embedding_cache import image_hasher, image_key, query_cache, result_cache
+from kernels import topk_filter_batch, warm_up as warm_up_kernels
+from batcher import MicroBatcher
+from embed_worker import EmbedWorkerPool
 
 load_dotenv()
 
@@ -29,55 +37,95 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# CORS configuration for frontend
+# CORS configuration for frontend: exact origins (plus any in CORS_ORIGINS)
+# and this project's Vercel preview deployments. Credentials are allowed, so
+# the regex must not match other *.vercel.app sites.
+ALLOWED_ORIGINS = (
+    "https://visual-product-matcher.vercel.app",
+    "http://localhost:3000",
+    "http://127.0.0.1:3000",
+) + tuple(origin.strip() for origin in os.getenv("CORS_ORIGINS", "").split(",") if origin.strip())
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "*",  # Allow all origins for now
-        "https://visual-product-matcher.vercel.app",
-        "https://*.vercel.app",
-        "http://localhost:3000",
-        "http://127.0.0.1:3000"
-    ],
+    allow_origins=ALLOWED_ORIGINS,
+    allow_origin_regex=r"https://visual-product-matcher(-[a-z0-9-]+)?\.vercel\.app",
     allow_credentials=True,
     allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=[
-        "*",
         "Content-Type",
         "Authorization",
         "Accept",
         "Origin",
         "X-Requested-With"
     ],
+    # Let browsers cache preflight responses instead of repeating OPTIONS
+    max_age=600,
 )
 
-product_database: Optional[Dict[str, Any]] = None
+# Uploads are read in chunks and rejected once they exceed this size
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(10 * 1024 * 1024)))
+
+# Threads used for query feature extraction
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "2"))
+# Worker processes for feature extraction (0 = extract in the embedding threads)
+embed_pool = EmbedWorkerPool(int(os.getenv("EMBED_PROCESSES", "0")))
+
+# int8 embeddings read a quarter of the bytes but can reorder near-tied products
+USE_INT8 = os.getenv("EMBEDDING_PRECISION", "float32").lower() == "int8"
+
+# Columnar product arrays (see product_store.py), set by load_product_database
+app.state.products = None
+# Approximate index for large catalogs (see ann_index.py), None means exact search
+app.state.ann = None
 
 # Configure image directory path for different environments  
 image_dir = os.getenv("IMAGE_DIRECTORY", "./images")
-if Path(image_dir).exists():
-    app.mount("/images", StaticFiles(directory=image_dir), name="images")
-    print(f"Serving images from {image_dir}")
+# When set, results link straight to images under this URL and the backend
+# does not serve /images at all
+IMAGE_CDN_BASE = os.getenv("IMAGE_CDN_BASE")
+
+image_root = Path(image_dir).resolve()
+
+# Product images never change under the same name, so browsers may keep them
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+async def get_image(name: str):
+    """Serve a product image with far-future caching headers"""
+    path = (image_root / name).resolve()
+    if not path.is_relative_to(image_root) or not path.is_file():
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path, headers={"Cache-Control": IMAGE_CACHE_CONTROL})
+
+if IMAGE_CDN_BASE:
+    print(f"Product images served from {IMAGE_CDN_BASE}")
 else:
-    print(f"Warning: Image directory {image_dir} not found")
-    # Create images directory if it doesn't exist
-    Path(image_dir).mkdir(exist_ok=True)
-    print(f"Created images directory: {image_dir}")
+    if Path(image_dir).exists():
+        print(f"Serving images from {image_dir}")
+    else:
+        print(f"Warning: Image directory {image_dir} not found")
+        # Create images directory if it doesn't exist
+        Path(image_dir).mkdir(exist_ok=True)
+        print(f"Created images directory: {image_dir}")
+    
+    app.get("/images/{name}", include_in_schema=False)(get_image)
 
 def load_product_database():
-    global product_database
-    
     # Try deployment database first (for production), then fallback to full database
     db_paths = ["product_database_deploy.json", "product_database.json"]
     
     for db_path in db_paths:
         if Path(db_path).exists():
             try:
-                with open(db_path, 'r') as f:
-                    product_database = json.load(f)
+                app.state.products = load_product_store(db_path, IMAGE_CDN_BASE)
+                app.state.ann = load_ann_index(app.state.products.emb, cache_dir_for(db_path),
+                                               app.state.products.cats)
                 
-                products_count = len(product_database.get('products', []))
+                products_count = len(app.state.products)
                 print(f"Loaded product database from {db_path} with {products_count} products")
+                if app.state.ann is not None:
+                    print(f"Using {app.state.ann}")
                 return True
                 
             except Exception as e:
@@ -99,6 +147,25 @@ async def startup_event():
         if not load_product_database():
             raise RuntimeError("Failed to load product database")
         
+        warm_up_kernels(app.state.products.emb.shape[1])
+        warm_up_feature_kernels()
+        
+        ranking_batcher.start()
+        embed_pool.start()
+        
+        # Feature extraction is CPU-bound: run it on a small dedicated pool so it
+        # neither blocks the event loop nor oversubscribes the CPU
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=EMBED_WORKERS, thread_name_prefix="embed")
+        )
+        
+        # Shared client so image downloads reuse pooled keep-alive connections
+        app.state.http = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(10.0),
+            limits=httpx.Limits(max_keepalive_connections=64, max_connections=128)
+        )
+        
         print("API ready!")
         
     except Exception as e:
@@ -107,30 +174,96 @@ async def startup_event():
         print(f"Traceback: {traceback.format_exc()}")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await ranking_batcher.stop()
+    embed_pool.shutdown()
+    
+    http_client = getattr(app.state, "http", None)
+    if http_client is not None:
+        await http_client.aclose()
+
+def collect_results(rows, scores):
+    """Gather product metadata for the rows picked by the ranking kernels"""
+    products = app.state.products
+    return [
+        {**products.product(row), 'similarity_score': float(score)}
+        for row, score in zip(rows.tolist(), scores)
+    ]
+
+def rank_batch(queries):
+    """Rank a batch of (query_vector, max_results, min_similarity) in one matrix product"""
+    vectors, ks, thresholds = zip(*queries)
+    products = app.state.products
+    if app.state.ann is not None:
+        return app.state.ann.search(np.stack(vectors), ks, thresholds)
+    if USE_INT8:
+        return topk_filter_batch(products.emb_q8, np.stack(vectors), ks, thresholds,
+                                 row_scale=products.emb_scale)
+    return topk_filter_batch(products.emb, np.stack(vectors), ks, thresholds)
+
+# Concurrent searches arriving within RANK_BATCH_DELAY_MS are ranked together
+ranking_batcher = MicroBatcher(
+    rank_batch,
+    max_batch=int(os.getenv("RANK_BATCH_SIZE", "16")),
+    max_delay=float(os.getenv("RANK_BATCH_DELAY_MS", "2")) / 1000
+)
+
+def search_response(method: SearchMethod, similar_products, start_time: float) -> Response:
+    """Encode a SearchResponse body with orjson
+
+    The rows are plain dicts that already match ProductResult, so the
+    routes skip response_model validation (no per-row models) and only
+    document SearchResponse in the OpenAPI schema.
+    """
+    return Response(orjson.dumps({
+        "query_method": method.value,
+        "total_results": len(similar_products),
+        "results": similar_products,
+        "processing_time": time.time() - start_time
+    }), media_type="application/json")
+
+async def search_local(query_embedding, min_similarity: float, max_results: int):
+    """Rank the local product matrix, reusing results cached for near-identical queries"""
+    params = (min_similarity, max_results)
+    query_vector = normalize_embeddings(query_embedding)[0]
+    
+    cached = result_cache.lookup(query_vector, params)
+    if cached is not None:
+        return cached
+    
+    rows, scores = await ranking_batcher.submit((query_vector, max_results, min_similarity))
+    results = collect_results(rows, scores)
+    
+    result_cache.store(query_vector, params, results)
+    return results
+
 @app.get("/", response_model=HealthResponse)
 async def root():
+    products = app.state.products
     return HealthResponse(
         status="healthy",
         message="Visual Product Matcher API is running",
-        database_loaded=product_database is not None,
-        total_products=len(product_database.get('products', [])) if product_database else 0
+        database_loaded=products is not None,
+        total_products=len(products) if products is not None else 0
     )
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
+    products = app.state.products
     return HealthResponse(
-        status="healthy" if product_database else "unhealthy",
-        message="Database loaded successfully" if product_database else "Database not loaded",
-        database_loaded=product_database is not None,
-        total_products=len(product_database.get('products', [])) if product_database else 0
+        status="healthy" if products is not None else "unhealthy",
+        message="Database loaded successfully" if products is not None else "Database not loaded",
+        database_loaded=products is not None,
+        total_products=len(products) if products is not None else 0
     )
 
 @app.get("/categories")
 async def get_categories():
-    if not product_database:
+    if app.state.products is None:
         raise HTTPException(status_code=503, detail="Product database not loaded")
     
-    category_stats = get_category_stats(product_database)
+    category_stats = app.state.products.category_counts()
     
     return {
         "categories": list(category_stats.keys()),
@@ -138,7 +271,7 @@ async def get_categories():
         "total_categories": len(category_stats)
     }
 
-@app.post("/api/search/upload", response_model=SearchResponse)
+@app.post("/api/search/upload", response_model=None, responses={200: {"model": SearchResponse}})
 async def search_by_upload(
     file: UploadFile = File(...),
     min_similarity: float = Query(0.0, ge=0.0, le=1.0),
@@ -147,7 +280,7 @@ async def search_by_upload(
 ):
     """Search for similar products by uploading an image file"""
     
-    if not product_database:
+    if app.state.products is None:
         raise HTTPException(status_code=503, detail="Product database not loaded")
     
     # Validate file type
@@ -157,12 +290,23 @@ async def search_by_upload(
     start_time = time.time()
     
     try:
-        # Read image data
-        image_data = await file.read()
+        # Hash the upload in chunks straight from its spooled file instead of
+        # copying the whole body into a bytes object
+        hasher = image_hasher()
+        size = 0
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > MAX_UPLOAD_SIZE:
+                raise HTTPException(status_code=413, detail="Image too large")
+            hasher.update(chunk)
+        await file.seek(0)
         
         if use_pinecone and pinecone_service.index:
             # Use Pinecone for similarity search
-            query_embedding = pinecone_service.generate_embedding(image_data)
+            image_data = await file.read()
+            query_embedding = await asyncio.get_running_loop().run_in_executor(
+                None, pinecone_service.generate_embedding, image_data
+            )
             
             if not query_embedding:
                 raise HTTPException(status_code=400, detail="Failed to process image with Pinecone")
@@ -173,66 +317,47 @@ async def search_by_upload(
             similar_products = [p for p in similar_products if p['similarity_score'] >= min_similarity]
         else:
             # Use local similarity search
-            query_embedding = generate_query_embedding(image_data)
-            
-            if not query_embedding:
+            # PIL decodes directly from the upload's file object
+            try:
+                query_embedding = await asyncio.get_running_loop().run_in_executor(
+                    None, query_cache.get_or_compute,
+                    hasher.digest(), file.file, embed_pool.embed
+                )
+            except Exception:
                 raise HTTPException(status_code=400, detail="Failed to process image")
             
-            similar_products = find_similar_products(
-                query_embedding, 
-                product_database, 
-                min_similarity, 
-                max_results
-            )
-        
-        # Convert to response format
-        results = [
-            ProductResult(
-                product_id=product['product_id'],
-                product_name=product['product_name'],
-                category=product['category'],
-                image_path=product['image_path'],
-                similarity_score=product['similarity_score']
-            )
-            for product in similar_products
-        ]
+            similar_products = await search_local(query_embedding, min_similarity, max_results)
         
-        processing_time = time.time() - start_time
-        
-        return SearchResponse(
-            query_method=SearchMethod.FILE_UPLOAD,
-            total_results=len(results),
-            results=results,
-            processing_time=processing_time
-        )
+        return search_response(SearchMethod.FILE_UPLOAD, similar_products, start_time)
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-@app.post("/api/search/url", response_model=SearchResponse)
+@app.post("/api/search/url", response_model=None, responses={200: {"model": SearchResponse}})
 async def search_by_url(
     request: ImageSearchRequest,
     use_pinecone: bool = Query(False, description="Use Pinecone vector database for search")
 ):
     """Search for similar products by providing an image URL"""
     
-    if not product_database:
+    if app.state.products is None:
         raise HTTPException(status_code=503, detail="Product database not loaded")
     
     start_time = time.time()
     
     try:
         # Download image from URL
-        async with httpx.AsyncClient() as client:
-            response = await client.get(str(request.image_url))
-            response.raise_for_status()
-            image_data = response.content
+        response = await app.state.http.get(str(request.image_url))
+        response.raise_for_status()
+        image_data = response.content
         
         if use_pinecone and pinecone_service.index:
             # Use Pinecone for similarity search
-            query_embedding = pinecone_service.generate_embedding(image_data)
+            query_embedding = await asyncio.get_running_loop().run_in_executor(
+                None, pinecone_service.generate_embedding, image_data
+            )
             
             if not query_embedding:
                 raise HTTPException(status_code=400, detail="Failed to process image with Pinecone")
@@ -243,38 +368,17 @@ async def search_by_url(
             similar_products = [p for p in similar_products if p['similarity_score'] >= request.min_similarity]
         else:
             # Use local similarity search
-            query_embedding = generate_query_embedding(image_data)
-            
-            if not query_embedding:
+            try:
+                query_embedding = await asyncio.get_running_loop().run_in_executor(
+                    None, query_cache.get_or_compute,
+                    image_key(image_data), image_data, embed_pool.embed
+                )
+            except Exception:
                 raise HTTPException(status_code=400, detail="Failed to process image from URL")
             
-            similar_products = find_similar_products(
-                query_embedding, 
-                product_database, 
-                request.min_similarity, 
-                request.max_results
-            )
-        
-        # Convert to response format
-        results = [
-            ProductResult(
-                product_id=product['product_id'],
-                product_name=product['product_name'],
-                category=product['category'],
-                image_path=product['image_path'],
-                similarity_score=product['similarity_score']
-            )
-            for product in similar_products
-        ]
+            similar_products = await search_local(query_embedding, request.min_similarity, request.max_results)
         
-        processing_time = time.time() - start_time
-        
-        return SearchResponse(
-            query_method=SearchMethod.IMAGE_URL,
-            total_results=len(results),
-            results=results,
-            processing_time=processing_time
-        )
+        return search_response(SearchMethod.IMAGE_URL, similar_products, start_time)
         
     except httpx.HTTPError:
         raise HTTPException(status_code=400, detail="Failed to download image from URL")
@@ -287,21 +391,22 @@ async def search_by_url(
 async def get_product_details(product_id: str):
     """Get details for a specific product"""
     
-    if not product_database:
+    if app.state.products is None:
         raise HTTPException(status_code=503, detail="Product database not loaded")
     
-    products = product_database.get('products', [])
-    
-    for product in products:
-        if product['product_id'] == product_id:
-            return {
-                "product_id": product['product_id'],
-                "product_name": product['product_name'],
-                "category": product['category'],
-                "image_path": product['image_path']
-            }
+    product = app.state.products.get(product_id)
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
     
-    raise HTTPException(status_code=404, detail="Product not found")
+    return product
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Get query embedding and result cache statistics"""
+    return {
+        "embeddings": query_cache.stats(),
+        "results": result_cache.stats()
+    }
 
 @app.get("/api/pinecone/stats")
 async def get_pinecone_stats():
@@ -327,19 +432,28 @@ async def initialize_pinecone():
 # Error handling
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
-    return ErrorResponse(
-        error="Not Found",
-        message="The requested resource was not found"
+    return JSONResponse(
+        status_code=404,
+        content=jsonable_encoder(ErrorResponse(
+            error="Not Found",
+            message="The requested resource was not found",
+            details=getattr(exc, "detail", None)
+        ))
     )
 
 @app.exception_handler(500)
 async def internal_error_handler(request, exc):
-    return ErrorResponse(
-        error="Internal Server Error",
-        message="An unexpected error occurred",
-        details=str(exc)
+    return JSONResponse(
+        status_code=500,
+        content=jsonable_encoder(ErrorResponse(
+            error="Internal Server Error",
+            message="An unexpected error occurred",
+            details=str(exc)
+        ))
     )
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # uvicorn[standard] picks uvloop and httptools automatically
+    uvicorn.run("main:app", host="0.0.0.0", port=8000,
+                workers=int(os.getenv("WEB_CONCURRENCY", "1")))
@@ -9,6 +9,7 @@ Migration script to:
 import json
 import os
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from PIL import Image
 import logging
@@ -22,6 +23,49 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Image reads and embedding run in threads. PineconeService.generate_embedding
+# is a stub in this tree (it returns None), so there is no model forward pass
+# to batch or decode to shrink; the threads only overlap the file reads.
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "16"))
+# Products per concurrent Pinecone upsert request
+UPSERT_BATCH_SIZE = 100
+
+def embed_product(product):
+    """Embed one product's image, returning an updated copy or None"""
+    try:
+        # Load image
+        image_path = product.get('image_path', '')
+        if not image_path:
+            return None
+        
+        # Construct full image path
+        full_image_path = Path(f"../data_processing/dataset/Images/Images/{image_path.split('/')[-1]}")
+        
+        if not full_image_path.exists():
+            logger.warning(f"Image not found: {full_image_path}")
+            return None
+        
+        # Read image data
+        with open(full_image_path, 'rb') as img_file:
+            image_data = img_file.read()
+        
+        # Generate new embedding
+        embedding = pinecone_service.generate_embedding(image_data)
+        
+        if embedding:
+            # Update product with new embedding
+            updated_product = product.copy()
+            updated_product['embedding'] = embedding
+            logger.info(f"Generated embedding for product {product['product_id']}")
+            return updated_product
+        
+        logger.warning(f"Failed to generate embedding for product {product['product_id']}")
+        return None
+            
+    except Exception as e:
+        logger.error(f"Error processing product {product.get('product_id', 'unknown')}: {e}")
+        return None
+
 async def migrate_products_to_pinecone():
     """Migrate products from local database to Pinecone"""
     
@@ -46,48 +90,19 @@ async def migrate_products_to_pinecone():
     batch_size = 50
     updated_products = []
     
-    for i in range(0, len(products), batch_size):
-        batch = products[i:i + batch_size]
-        logger.info(f"Processing batch {i//batch_size + 1}: products {i+1} to {min(i+batch_size, len(products))}")
-        
-        for product in batch:
-            try:
-                # Load image
-                image_path = product.get('image_path', '')
-                if not image_path:
-                    continue
-                
-                # Construct full image path
-                full_image_path = Path(f"../data_processing/dataset/Images/Images/{image_path.split('/')[-1]}")
-                
-                if not full_image_path.exists():
-                    logger.warning(f"Image not found: {full_image_path}")
-                    continue
-                
-                # Read image data
-                with open(full_image_path, 'rb') as img_file:
-                    image_data = img_file.read()
-                
-                # Generate new embedding
-                embedding = pinecone_service.generate_embedding(image_data)
-                
-                if embedding:
-                    # Update product with new embedding
-                    updated_product = product.copy()
-                    updated_product['embedding'] = embedding
-                    updated_products.append(updated_product)
-                    logger.info(f"Generated embedding for product {product['product_id']}")
-                else:
-                    logger.warning(f"Failed to generate embedding for product {product['product_id']}")
-                    
-            except Exception as e:
-                logger.error(f"Error processing product {product.get('product_id', 'unknown')}: {e}")
-                continue
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as pool:
+        for i in range(0, len(products), batch_size):
+            batch = products[i:i + batch_size]
+            logger.info(f"Processing batch {i//batch_size + 1}: products {i+1} to {min(i+batch_size, len(products))}")
+            updated_products.extend(p for p in pool.map(embed_product, batch) if p)
     
     # Upload to Pinecone
     if updated_products:
         logger.info(f"Uploading {len(updated_products)} products to Pinecone...")
-        await pinecone_service.upsert_products(updated_products)
+        await asyncio.gather(*(
+            pinecone_service.upsert_products(updated_products[j:j + UPSERT_BATCH_SIZE])
+            for j in range(0, len(updated_products), UPSERT_BATCH_SIZE)
+        ))
         
         # Save updated database
         updated_database = {
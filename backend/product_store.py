@@ -0,0 +1,191 @@
+"""
+Columnar (structure-of-arrays) cache for the product database.
+
+The JSON database is parsed once and written out as a directory of .npy
+files next to it. Later startups memory-map those files instead of building
+a Python dict per product, and the embeddings live in one contiguous
+(N, D) float32 matrix so similarity search can run over it directly. An
+int8 copy with per-row scales is stored alongside for EMBEDDING_PRECISION=int8.
+
+Invariant: emb rows are already passed through normalize_embeddings when the
+cache is built (rows without an embedding are NaN). Queries are normalized
+once per request, so ranking is a plain dot product; nothing downstream
+should normalize the matrix again.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional, Any
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from similarity import normalize_embeddings
+from kernels import quantize_int8
+
+EMBEDDING_DIMENSION = 50
+
+# Metadata columns stored alongside the embedding matrix
+SOA_FIELDS = {
+    "ids": "product_id",
+    "names": "product_name",
+    "cats": "category",
+    "paths": "image_path",
+}
+
+# Written before emb.npy, whose presence marks a complete cache
+CACHE_ARRAYS = list(SOA_FIELDS) + ["emb_q8", "emb_scale", "emb"]
+
+
+class ProductStore:
+    """Parallel product arrays with an id -> row index"""
+
+    def __init__(self, emb: np.ndarray, ids: np.ndarray, names: np.ndarray,
+                 cats: np.ndarray, paths: np.ndarray,
+                 emb_q8: np.ndarray, emb_scale: np.ndarray):
+        self.emb = emb
+        self.emb_q8 = emb_q8
+        self.emb_scale = emb_scale
+        self.ids = ids
+        self.names = names
+        self.cats = cats
+        self.paths = paths
+        self.by_id = {product_id: row for row, product_id in enumerate(ids.tolist())}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def product(self, row: int) -> Dict[str, Any]:
+        """Metadata for a single row"""
+        return {
+            "product_id": str(self.ids[row]),
+            "product_name": str(self.names[row]),
+            "category": str(self.cats[row]),
+            "image_path": str(self.paths[row]),
+        }
+
+    def get(self, product_id: str) -> Optional[Dict[str, Any]]:
+        row = self.by_id.get(product_id)
+        return self.product(row) if row is not None else None
+
+    def category_counts(self) -> Dict[str, int]:
+        categories, counts = np.unique(self.cats, return_counts=True)
+        return {str(category): int(count) for category, count in zip(categories, counts)}
+
+
+def cache_dir_for(db_path) -> Path:
+    """product_database_deploy.json -> product_database_deploy.soa/"""
+    return Path(db_path).with_suffix(".soa")
+
+
+def read_database(db_path) -> Dict:
+    """Parse a JSON product database, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(Path(db_path).read_bytes())
+    with open(db_path, "r") as f:
+        return json.load(f)
+
+
+def dump_database(product_database: Dict) -> bytes:
+    """Serialize a product database as 2-space indented JSON, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(product_database, option=orjson.OPT_INDENT_2)
+    return json.dumps(product_database, indent=2).encode()
+
+
+def _arrays_from_database(product_database: Dict) -> Dict[str, np.ndarray]:
+    products = product_database.get("products", [])
+
+    emb = np.full((len(products), EMBEDDING_DIMENSION), np.nan, dtype=np.float32)
+    for row, product in enumerate(products):
+        embedding = product.get("embedding")
+        if embedding and len(embedding) == EMBEDDING_DIMENSION:
+            emb[row] = embedding
+
+    usable = ~np.isnan(emb[:, 0])
+    emb[usable] = normalize_embeddings(emb[usable])
+
+    emb_q8, emb_scale = quantize_int8(emb)
+    arrays = {"emb": np.ascontiguousarray(emb), "emb_q8": emb_q8, "emb_scale": emb_scale}
+    for name, key in SOA_FIELDS.items():
+        # Fixed-width unicode so the columns can be memory-mapped too
+        arrays[name] = np.array([str(p.get(key, "")) for p in products], dtype=np.str_)
+    return arrays
+
+
+def save_atomic(path: Path, array: np.ndarray):
+    """np.save via a temporary file, so concurrent workers never map a partial file"""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def build_soa_cache(db_path, cache_dir=None) -> Dict[str, np.ndarray]:
+    """Convert a JSON product database into the .npy cache and return the arrays"""
+    arrays = _arrays_from_database(read_database(db_path))
+
+    cache_dir = Path(cache_dir) if cache_dir else cache_dir_for(db_path)
+    cache_dir.mkdir(exist_ok=True)
+    # Embeddings are written last so an interrupted build is never mistaken for a complete one
+    for name in CACHE_ARRAYS:
+        save_atomic(cache_dir / f"{name}.npy", arrays[name])
+
+    return arrays
+
+
+def load_soa_cache(cache_dir) -> ProductStore:
+    cache_dir = Path(cache_dir)
+    arrays = {
+        name: np.load(cache_dir / f"{name}.npy", mmap_mode="r")
+        for name in CACHE_ARRAYS
+    }
+    return ProductStore(**arrays)
+
+
+def is_cache_fresh(db_path, cache_dir=None) -> bool:
+    cache_dir = Path(cache_dir) if cache_dir else cache_dir_for(db_path)
+    emb_path = cache_dir / "emb.npy"
+    if not all((cache_dir / f"{name}.npy").exists() for name in CACHE_ARRAYS):
+        return False
+    return emb_path.stat().st_mtime >= Path(db_path).stat().st_mtime
+
+
+def with_image_base(store: ProductStore, image_base: Optional[str]) -> ProductStore:
+    """Point every image_path at image_base/<file name> (e.g. a CDN), once per load"""
+    if image_base:
+        file_names = np.char.rpartition(store.paths.astype(str), "/")[:, 2]
+        store.paths = np.char.add(image_base.rstrip("/") + "/", file_names)
+    return store
+
+
+def load_product_store(db_path, image_base: Optional[str] = None) -> ProductStore:
+    """Load the memory-mapped cache for db_path, rebuilding it if the JSON is newer
+
+    With image_base set, image paths are returned as URLs under it.
+    """
+    cache_dir = cache_dir_for(db_path)
+
+    if not is_cache_fresh(db_path, cache_dir):
+        try:
+            build_soa_cache(db_path, cache_dir)
+            print(f"Built product cache in {cache_dir}")
+        except OSError as e:
+            # Read-only filesystem: keep the arrays in memory instead
+            print(f"Could not write product cache {cache_dir}: {e}")
+            return with_image_base(ProductStore(**_arrays_from_database(read_database(db_path))), image_base)
+
+    return with_image_base(load_soa_cache(cache_dir), image_base)
+
+
+if __name__ == "__main__":
+    import sys
+
+    for path in sys.argv[1:] or ["product_database_deploy.json"]:
+        arrays = build_soa_cache(path)
+        print(f"Cached {len(arrays['ids'])} products from {path} in {cache_dir_for(path)}")
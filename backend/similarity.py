@@ -1,19 +1,42 @@
 import math
-from typing import List, Dict
+import os
+from typing import BinaryIO, List, Dict, Tuple, Union
 from PIL import Image
 import io
+import numpy as np
 
-# TensorFlow is disabled for deployment simplicity
-TF_HUB_AVAILABLE = False
+# Numba is optional: without it the per-pixel scans below run as NumPy
+# array passes. Same threading-layer preference as kernels.py, in case
+# this module is the first to import numba.
+os.environ.setdefault("NUMBA_THREADING_LAYER_PRIORITY", "omp tbb workqueue")
 
-def calculate_cosine_similarity(embedding1: List[float], embedding2: List[float]) -> float:
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Feature groups compared by calculate_enhanced_similarity: (start, end, weight)
+FEATURE_GROUPS = [
+    (0, 17, 8.0),    # Garment shape
+    (17, 32, 4.0),   # Structural patterns
+    (32, 42, 0.5),   # Color
+    (42, 50, 2.0),   # Texture & padding
+]
+GROUP_STARTS = np.array([start for start, _, _ in FEATURE_GROUPS])
+GROUP_WEIGHTS = np.array([weight for _, _, weight in FEATURE_GROUPS])
+
+def calculate_cosine_similarity(embedding1: np.ndarray, embedding2: np.ndarray) -> float:
     try:
+        vector1 = np.asarray(embedding1, dtype=np.float64)
+        vector2 = np.asarray(embedding2, dtype=np.float64)
+        
         # Calculate dot product
-        dot_product = sum(a * b for a, b in zip(embedding1, embedding2))
+        dot_product = np.dot(vector1, vector2)
         
         # Calculate magnitudes
-        magnitude1 = math.sqrt(sum(a * a for a in embedding1))
-        magnitude2 = math.sqrt(sum(b * b for b in embedding2))
+        magnitude1 = math.sqrt(np.dot(vector1, vector1))
+        magnitude2 = math.sqrt(np.dot(vector2, vector2))
         
         # Avoid division by zero
         if magnitude1 == 0 or magnitude2 == 0:
@@ -26,126 +49,208 @@ def calculate_cosine_similarity(embedding1: List[float], embedding2: List[float]
         print(f"Error calculating similarity: {e}")
         return 0.0
 
-# Global model cache
-_model_cache = None
-
-def get_vision_model():
-    """Get or load the vision model for feature extraction"""
-    global _model_cache
-    if _model_cache is None and TF_HUB_AVAILABLE:
-        try:
-            # Use MobileNet for lightweight feature extraction
-            _model_cache = hub.load("https://tfhub.dev/google/imagenet/mobilenet_v2_100_224/feature_vector/5")
-            print("Loaded MobileNet model for enhanced similarity")
-        except Exception as e:
-            print(f"Failed to load TF Hub model: {e}")
-            _model_cache = False
-    return _model_cache if _model_cache is not False else None
-
-def generate_deep_features(image: Image.Image) -> List[float]:
-    """Extract deep learning features from image"""
-    model = get_vision_model()
-    if model is None:
-        return []
-    
-    try:
-        # Prepare image for model
-        img_array = np.array(image.resize((224, 224)))
-        img_array = img_array / 255.0  # Normalize
-        img_array = np.expand_dims(img_array, axis=0)  # Add batch dimension
-        
-        # Extract features
-        features = model(img_array)
-        return features.numpy().flatten()[:128].tolist()  # Use first 128 features
-    except Exception as e:
-        print(f"Error extracting deep features: {e}")
-        return []
+CHANNEL_VALUES = np.arange(256, dtype=np.float64)
+
+def channel_statistics(image: Image.Image):
+    """Per-channel (counts, means, stds) of an RGB image from PIL's histogram
+
+    counts is the (3, 256) value histogram; the moments are computed from it
+    rather than from the pixels.
+    """
+    counts = np.array(image.histogram(), dtype=np.int64).reshape(3, 256)
+    n = image.width * image.height
+    channel_means = counts @ CHANNEL_VALUES / n
+    channel_stds = np.sqrt(np.einsum('cv,cv->c', counts, np.square(CHANNEL_VALUES - channel_means[:, None])) / n)
+    return counts, channel_means, channel_stds
+
+if NUMBA_AVAILABLE:
+
+    # Numba's cache records the defining module by name, so this module must
+    # only ever be imported as `similarity` (the root scripts put backend/ on
+    # sys.path rather than importing backend.similarity)
+
+    @njit(cache=True, nogil=True)
+    def _scan_image(rgb):
+        """One row-major scan of an (H, W, 3) uint8 image for every per-pixel feature pass
+
+        Returns (gray, edge_counts, profile, edges): the channel-mean
+        intensity, the _strong_edge_counts_numpy pair, the
+        _intensity_profile_numpy tuple and the _edge_responses_numpy tuple,
+        with identical values.
+        """
+        height, width, channels = rgb.shape
+        gray = np.empty((height, width))
+
+        # Strong (> 30) intensity steps per row and per column
+        edges_per_row = np.zeros(height, dtype=np.int64)
+        edges_per_col = np.zeros(width, dtype=np.int64)
+
+        # Shape, symmetry, region and center-of-mass accumulators; regions are
+        # thirds of the height by halves of the width
+        row_widths = np.zeros(height, dtype=np.int64)
+        half_sums = np.zeros(2)
+        half_counts = np.zeros(2, dtype=np.int64)
+        region_sums = np.zeros(6)
+        region_counts = np.zeros(6, dtype=np.int64)
+        moments = np.zeros(3)  # sum of x * I, y * I and I over non-background pixels
+
+        # Gradient magnitudes of the interior pixels and edge counts
+        responses = np.empty((max(height - 2, 0), max(width - 2, 0)))
+        strong_edges = 0
+        directed_edges = 0
+        horizontal_edges = 0
+
+        for y in range(height):
+            third = 0 if y < height // 3 else (1 if y < 2 * height // 3 else 2)
+            row_start = -1
+            row_end = -1
+            for x in range(width):
+                total = 0
+                for c in range(channels):
+                    total += np.int64(rgb[y, x, c])
+                pixel_intensity = total / 3
+                gray[y, x] = pixel_intensity
+
+                # Steps from the left and upper neighbours, already scanned
+                if x > 0 and abs(gray[y, x - 1] - pixel_intensity) > 30:
+                    edges_per_row[y] += 1
+                if y > 0 and abs(gray[y - 1, x] - pixel_intensity) > 30:
+                    edges_per_col[x] += 1
+
+                half = 0 if x < width // 2 else 1
+                half_sums[half] += pixel_intensity
+                half_counts[half] += 1
+                region_sums[2 * third + half] += pixel_intensity
+                region_counts[2 * third + half] += 1
+
+                if pixel_intensity > 50:  # Non-background pixel
+                    if row_start < 0:
+                        row_start = x
+                    row_end = x
+                    moments[0] += x * pixel_intensity
+                    moments[1] += y * pixel_intensity
+                    moments[2] += pixel_intensity
+
+                if 0 < y < height - 1 and 0 < x < width - 1:
+                    # Channel-summed absolute differences to the four neighbours
+                    diff_left = diff_right = diff_up = diff_down = 0
+                    for c in range(channels):
+                        center = np.int64(rgb[y, x, c])
+                        diff_left += abs(center - rgb[y, x - 1, c])
+                        diff_right += abs(center - rgb[y, x + 1, c])
+                        diff_up += abs(center - rgb[y - 1, x, c])
+                        diff_down += abs(center - rgb[y + 1, x, c])
+
+                    response = np.sqrt(np.float64(diff_right * diff_right + diff_down * diff_down))
+                    responses[y - 1, x - 1] = response
+                    if response > 50:
+                        strong_edges += 1
+                    if response > 30:
+                        directed_edges += 1
+                        if diff_left + diff_right > diff_up + diff_down:
+                            horizontal_edges += 1
+            if row_start >= 0:
+                row_widths[y] = row_end - row_start
+
+        return (
+            gray,
+            (edges_per_row, edges_per_col),
+            (row_widths, half_sums, half_counts, region_sums, region_counts, moments),
+            (responses, strong_edges, directed_edges, horizontal_edges),
+        )
 
-def mean(values):
-    return sum(values) / len(values) if values else 0
+def warm_up_feature_kernels():
+    """Compile (or load from Numba's cache) the feature kernel before the first image"""
+    if NUMBA_AVAILABLE:
+        # Read-only like np.asarray(image), which Numba compiles separately
+        rgb = np.zeros((3, 3, 3), dtype=np.uint8)
+        rgb.flags.writeable = False
+        _scan_image(rgb)
 
-def std_dev(values):
-    if not values:
-        return 0
-    m = mean(values)
-    variance = sum((x - m) ** 2 for x in values) / len(values)
-    return math.sqrt(variance)
+def _strong_edge_counts_numpy(gray: np.ndarray):
+    """Strong (> 30) intensity steps per row and per column of an (H, W) intensity image"""
+    # Strong edges between horizontal (row-wise) and vertical (column-wise) neighbours
+    edges_per_row = np.count_nonzero(np.abs(np.diff(gray, axis=1)) > 30, axis=1)
+    edges_per_col = np.count_nonzero(np.abs(np.diff(gray, axis=0)) > 30, axis=0)
+    return edges_per_row, edges_per_col
 
-def simple_histogram(values, bins=5, range_min=0, range_max=255):
-    """Simple histogram implementation"""
-    bin_width = (range_max - range_min) / bins
-    hist = [0] * bins
+def _edge_responses_numpy(rgb: np.ndarray):
+    """Gradient magnitudes of the interior pixels of an (H, W, 3) image
+
+    Returns the (H-2, W-2) magnitudes and how many of them are strong
+    (> 50), directed (> 30), and directed and more horizontal than vertical.
+    """
+    pixels = rgb.astype(np.float64)
+    
+    # Channel-summed absolute differences between each interior pixel and its
+    # four neighbours, as (H-2, W-2) arrays
+    center = pixels[1:-1, 1:-1]
+    diff_left = np.abs(center - pixels[1:-1, :-2]).sum(axis=2)
+    diff_right = np.abs(center - pixels[1:-1, 2:]).sum(axis=2)
+    diff_up = np.abs(center - pixels[:-2, 1:-1]).sum(axis=2)
+    diff_down = np.abs(center - pixels[2:, 1:-1]).sum(axis=2)
+    
+    # Gradient magnitude from the horizontal (right) and vertical (down) gradients
+    responses = np.sqrt(diff_right ** 2 + diff_down ** 2)
     
-    for val in values:
-        bin_index = min(int((val - range_min) / bin_width), bins - 1)
-        if bin_index >= 0:
-            hist[bin_index] += 1
+    # Is each edge more horizontal or vertical
+    edge_mask = responses > 30
+    horizontal_edges = int(np.count_nonzero(edge_mask & (diff_left + diff_right > diff_up + diff_down)))
     
-    return hist
+    return responses, int(np.count_nonzero(responses > 50)), int(np.count_nonzero(edge_mask)), horizontal_edges
 
-def generate_enhanced_color_features(image: Image.Image) -> List[float]:
-    """Generate enhanced color and texture features"""
-    features = []
+def _intensity_profile_numpy(gray: np.ndarray):
+    """Row widths and the symmetry, region and center-of-mass sums of an intensity image
+
+    Regions are thirds of the height by halves of the width. Returns
+    (row_widths, half_sums, half_counts, region_sums, region_counts,
+    moments).
+    """
+    height, width = gray.shape
+    garment = gray > 50  # Non-background pixels
     
-    # Convert to different color spaces for better analysis
-    rgb_img = image.convert('RGB')
+    # First and last garment pixel of each row
+    first = garment.argmax(axis=1)
+    last = width - 1 - garment[:, ::-1].argmax(axis=1)
+    row_widths = np.where(garment.any(axis=1), last - first, 0)
     
-    # RGB analysis
-    rgb_pixels = list(rgb_img.getdata())
+    halves = (slice(0, width // 2), slice(width // 2, width))
+    thirds = (slice(0, height // 3), slice(height // 3, 2 * height // 3), slice(2 * height // 3, height))
+    half_sums = [gray[:, half].sum() for half in halves]
+    half_counts = [gray[:, half].size for half in halves]
+    region_sums = [gray[third, half].sum() for third in thirds for half in halves]
+    region_counts = [gray[third, half].size for third in thirds for half in halves]
     
-    if rgb_pixels:
-        # RGB statistics
-        rgb_means = [mean([p[i] for p in rgb_pixels]) / 255.0 for i in range(3)]
-        rgb_stds = [std_dev([p[i] for p in rgb_pixels]) / 255.0 for i in range(3)]
-        
-        features.extend(rgb_means + rgb_stds)
-        
-        # Color distribution (histogram)
-        for channel in range(3):
-            rgb_vals = [p[channel] for p in rgb_pixels]
-            hist = simple_histogram(rgb_vals, bins=5, range_min=0, range_max=255)
-            hist_norm = [h / len(rgb_pixels) for h in hist]
-            features.extend(hist_norm)
-        
-        # Brightness and contrast  
-        brightness_vals = [sum(p) / 3 for p in rgb_pixels]
-        brightness = mean(brightness_vals) / 255.0
-        contrast = std_dev(brightness_vals) / 255.0
-        features.extend([brightness, contrast])
+    mass = np.where(garment, gray, 0.0)
+    moments = [
+        mass.sum(axis=0) @ np.arange(width),
+        mass.sum(axis=1) @ np.arange(height),
+        mass.sum(),
+    ]
     
-    return features
+    return row_widths, half_sums, half_counts, region_sums, region_counts, moments
+
+def _scan_image_numpy(rgb: np.ndarray):
+    """_scan_image with NumPy array passes, for when Numba is not installed"""
+    gray = rgb.sum(axis=2, dtype=np.int64) / 3
+    return gray, _strong_edge_counts_numpy(gray), _intensity_profile_numpy(gray), _edge_responses_numpy(rgb)
+
+def detect_garment_silhouette(image: Image.Image, edge_counts=None) -> Dict[str, float]:
+    """Garment silhouette detection for shape-based classification
 
-def detect_garment_silhouette(image: Image.Image) -> Dict[str, float]:
-    """Garment silhouette detection for shape-based classification"""
+    edge_counts (the (edges_per_row, edges_per_col) pair from the image scan)
+    can be passed in when the caller already computed it.
+    """
     width, height = image.size
-    rgb_pixels = list(image.getdata())
-    
-    # Convert to grayscale for shape analysis
-    gray_pixels = [sum(p) / 3 for p in rgb_pixels]
     
     # 1. Garment boundary detection using edge concentration
-    edges_per_row = []
-    edges_per_col = []
-    
-    # Row-wise edge detection (horizontal boundaries)
-    for y in range(height):
-        row_edges = 0
-        for x in range(width - 1):
-            current = gray_pixels[y * width + x]
-            next_pixel = gray_pixels[y * width + (x + 1)]
-            if abs(current - next_pixel) > 30:  # Strong edge
-                row_edges += 1
-        edges_per_row.append(row_edges)
-    
-    # Column-wise edge detection (vertical boundaries)
-    for x in range(width):
-        col_edges = 0
-        for y in range(height - 1):
-            current = gray_pixels[y * width + x]
-            next_pixel = gray_pixels[(y + 1) * width + x]
-            if abs(current - next_pixel) > 30:  # Strong edge
-                col_edges += 1
-        edges_per_col.append(col_edges)
+    if edge_counts is None:
+        # Convert to grayscale for shape analysis
+        gray = np.asarray(image, dtype=np.uint8).sum(axis=2, dtype=np.int64) / 3
+        edge_counts = _strong_edge_counts_numpy(gray)
+    edges_per_row, edges_per_col = edge_counts
+    edges_per_row = edges_per_row.tolist()
+    edges_per_col = edges_per_col.tolist()
     
     # 2. Garment shape analysis
     aspect_ratio = width / height if height > 0 else 1.0
@@ -209,10 +314,17 @@ def detect_garment_silhouette(image: Image.Image) -> Dict[str, float]:
         'sleeve_prominence': sleeve_prominence
     }
 
-def extract_visual_features_from_image(image: Image.Image) -> List[float]:
-    """Extract garment-focused visual features for clothing classification"""
+def extract_visual_features_from_image(image: Image.Image, strict: bool = False) -> np.ndarray:
+    """Extract garment-focused visual features for clothing classification
+
+    Returns a float32 array of 50 features. If extraction fails this is the
+    0.1 fallback embedding, unless strict is set, in which case the error is
+    raised instead.
+    """
     try:
-        # Resize for consistency
+        # Resize for consistency. thumbnail() already draft-decodes JPEGs and
+        # reduce()s before resampling, so LANCZOS only runs on a ~2x larger image.
+        # Keep the filter in sync with the stored product embeddings.
         if image.width > 224 or image.height > 224:
             image.thumbnail((224, 224), Image.Resampling.LANCZOS)
         
@@ -222,15 +334,20 @@ def extract_visual_features_from_image(image: Image.Image) -> List[float]:
         features = []
         width, height = image.size
         
-        # Get pixel data
-        rgb_pixels = list(image.getdata())
+        # Get pixel data as an (H, W, 3) array and its per-pixel intensity
+        rgb = np.asarray(image, dtype=np.uint8)
+        
+        if rgb.size == 0:
+            raise ValueError("image has no pixels")
         
-        if not rgb_pixels:
-            return [0.1] * 50
+        # Every per-pixel pass (intensity, edge counts, shape profile, edge
+        # responses) in one scan
+        scan = _scan_image if NUMBA_AVAILABLE else _scan_image_numpy
+        gray, edge_counts, profile, edges = scan(rgb)
         
         # SECTION 1: GARMENT SHAPE ANALYSIS
         
-        silhouette_data = detect_garment_silhouette(image)
+        silhouette_data = detect_garment_silhouette(image, edge_counts)
         
         # Core shape features (9 features)
         features.extend([
@@ -245,31 +362,21 @@ def extract_visual_features_from_image(image: Image.Image) -> List[float]:
             silhouette_data['sleeve_prominence']
         ])
         
+        # Row widths, half / region intensity sums and intensity moments
+        row_widths, half_sums, half_counts, region_sums, region_counts, moments = profile
+        
         # Shape analysis (11 features)
         # Garment width distribution analysis
-        row_widths = []
-        for y in range(height):
-            row_start = None
-            row_end = None
-            for x in range(width):
-                pixel_intensity = sum(rgb_pixels[y * width + x]) / 3
-                if pixel_intensity > 50:  # Non-background pixel
-                    if row_start is None:
-                        row_start = x
-                    row_end = x
-            
-            if row_start is not None and row_end is not None:
-                row_widths.append(row_end - row_start)
-            else:
-                row_widths.append(0)
-        
         # Analyze garment width patterns
-        if row_widths:
-            top_quarter_width = mean(row_widths[:height//4]) if height//4 > 0 else 0
-            middle_half_width = mean(row_widths[height//4:3*height//4]) if height//4 > 0 else 0
-            bottom_quarter_width = mean(row_widths[3*height//4:]) if height//4 > 0 else 0
+        if len(row_widths):
+            if height // 4 > 0:
+                top_quarter_width = float(row_widths[:height//4].mean())
+                middle_half_width = float(row_widths[height//4:3*height//4].mean())
+                bottom_quarter_width = float(row_widths[3*height//4:].mean())
+            else:
+                top_quarter_width = middle_half_width = bottom_quarter_width = 0
             
-            max_width = max(row_widths) if row_widths else 1
+            max_width = int(row_widths.max())
             if max_width > 0:
                 top_width_ratio = top_quarter_width / max_width
                 middle_width_ratio = middle_half_width / max_width
@@ -278,7 +385,7 @@ def extract_visual_features_from_image(image: Image.Image) -> List[float]:
                 top_width_ratio = middle_width_ratio = bottom_width_ratio = 0.5
             
             # Garment taper analysis (important for distinguishing fits)
-            width_variance = std_dev(row_widths) / max_width if max_width > 0 else 0
+            width_variance = float(row_widths.std()) / max_width if max_width > 0 else 0
             
             # A-line vs straight vs tapered analysis
             if bottom_width_ratio > top_width_ratio + 0.2:
@@ -303,16 +410,8 @@ def extract_visual_features_from_image(image: Image.Image) -> List[float]:
             length_category = 0.2  # Trousers/pants
         
         # Symmetry analysis (important for garment type)
-        left_half_pixels = []
-        right_half_pixels = []
-        for y in range(height):
-            for x in range(width//2):
-                left_half_pixels.append(sum(rgb_pixels[y * width + x]) / 3)
-            for x in range(width//2, width):
-                right_half_pixels.append(sum(rgb_pixels[y * width + x]) / 3)
-        
-        left_mean = mean(left_half_pixels) if left_half_pixels else 0
-        right_mean = mean(right_half_pixels) if right_half_pixels else 0
+        left_mean = half_sums[0] / half_counts[0] if half_counts[0] else 0
+        right_mean = half_sums[1] / half_counts[1] if half_counts[1] else 0
         symmetry_score = 1.0 - abs(left_mean - right_mean) / 255.0
         
         features.extend([
@@ -323,58 +422,17 @@ def extract_visual_features_from_image(image: Image.Image) -> List[float]:
         # SECTION 2: STRUCTURAL PATTERN ANALYSIS
         
         # Edge analysis for garment boundaries
-        edge_responses = []
-        for y in range(1, height - 1):
-            for x in range(1, width - 1):
-                center = rgb_pixels[y * width + x]
-                # Use Sobel-like operators for better edge detection
-                neighbors = [
-                    rgb_pixels[(y-1) * width + (x-1)],  # Top-left
-                    rgb_pixels[(y-1) * width + x],       # Top
-                    rgb_pixels[(y-1) * width + (x+1)],   # Top-right
-                    rgb_pixels[y * width + (x-1)],       # Left
-                    rgb_pixels[y * width + (x+1)],       # Right
-                    rgb_pixels[(y+1) * width + (x-1)],   # Bottom-left
-                    rgb_pixels[(y+1) * width + x],       # Bottom
-                    rgb_pixels[(y+1) * width + (x+1)]    # Bottom-right
-                ]
-                
-                # Calculate gradient magnitude
-                gx = sum(abs(center[i] - neighbors[4][i]) for i in range(3))  # Horizontal gradient
-                gy = sum(abs(center[i] - neighbors[6][i]) for i in range(3))  # Vertical gradient
-                edge_strength = math.sqrt(gx**2 + gy**2)
-                edge_responses.append(edge_strength)
-        
-        if edge_responses:
-            edge_mean = mean(edge_responses) / 255.0
-            edge_std = std_dev(edge_responses) / 255.0
+        edge_responses, strong_edges, directed_edges, horizontal_edges = edges
+        
+        if edge_responses.size:
+            edge_mean = float(edge_responses.mean()) / 255.0
+            edge_std = float(edge_responses.std()) / 255.0
             
             # Edge distribution analysis
-            strong_edges = [e for e in edge_responses if e > 50]
-            edge_density = len(strong_edges) / len(edge_responses)
+            edge_density = float(strong_edges) / edge_responses.size
             
-            # Directional edge analysis
-            horizontal_edges = 0
-            vertical_edges = 0
-            
-            for y in range(1, height - 1):
-                for x in range(1, width - 1):
-                    idx = (y - 1) * (width - 2) + (x - 1)
-                    if idx < len(edge_responses) and edge_responses[idx] > 30:
-                        # Check if edge is more horizontal or vertical
-                        center = rgb_pixels[y * width + x]
-                        left = rgb_pixels[y * width + (x-1)]
-                        right = rgb_pixels[y * width + (x+1)]
-                        top = rgb_pixels[(y-1) * width + x]
-                        bottom = rgb_pixels[(y+1) * width + x]
-                        
-                        h_diff = sum(abs(center[i] - left[i]) + abs(center[i] - right[i]) for i in range(3))
-                        v_diff = sum(abs(center[i] - top[i]) + abs(center[i] - bottom[i]) for i in range(3))
-                        
-                        if h_diff > v_diff:
-                            horizontal_edges += 1
-                        else:
-                            vertical_edges += 1
+            # Directional edge analysis: is each edge more horizontal or vertical
+            vertical_edges = directed_edges - horizontal_edges
             
             total_directed_edges = horizontal_edges + vertical_edges
             h_edge_ratio = horizontal_edges / max(total_directed_edges, 1)
@@ -385,45 +443,14 @@ def extract_visual_features_from_image(image: Image.Image) -> List[float]:
             features.extend([0.1, 0.1, 0.1, 0.5, 0.5])
         
         # Garment region analysis (10 features)
-        # Divide image into regions and analyze content
-        regions = {
-            'top_left': (0, 0, width//2, height//3),
-            'top_right': (width//2, 0, width, height//3),
-            'middle_left': (0, height//3, width//2, 2*height//3),
-            'middle_right': (width//2, height//3, width, 2*height//3),
-            'bottom_left': (0, 2*height//3, width//2, height),
-            'bottom_right': (width//2, 2*height//3, width, height)
-        }
-        
-        region_features = []
-        for region_name, (x1, y1, x2, y2) in regions.items():
-            region_pixels = []
-            for y in range(y1, y2):
-                for x in range(x1, x2):
-                    if y < height and x < width:
-                        region_pixels.append(sum(rgb_pixels[y * width + x]) / 3)
-            
-            if region_pixels:
-                region_intensity = mean(region_pixels) / 255.0
-                region_variance = std_dev(region_pixels) / 255.0
-            else:
-                region_intensity = 0.5
-                region_variance = 0.1
-            
-            region_features.extend([region_intensity])
+        # Mean intensity of each region: top, middle and bottom thirds, left and right halves
+        region_features = [
+            region_sum / region_count / 255.0 if region_count else 0.5
+            for region_sum, region_count in zip(region_sums, region_counts)
+        ]
         
         # Add overall structural features
-        center_mass_x = 0
-        center_mass_y = 0
-        total_mass = 0
-        
-        for y in range(height):
-            for x in range(width):
-                pixel_intensity = sum(rgb_pixels[y * width + x]) / 3
-                if pixel_intensity > 50:  # Non-background
-                    center_mass_x += x * pixel_intensity
-                    center_mass_y += y * pixel_intensity
-                    total_mass += pixel_intensity
+        center_mass_x, center_mass_y, total_mass = moments
         
         if total_mass > 0:
             center_x = (center_mass_x / total_mass) / width
@@ -442,21 +469,20 @@ def extract_visual_features_from_image(image: Image.Image) -> List[float]:
         # SECTION 3: COLOR FEATURES
         
         # Basic color statistics (6 features)
-        rgb_means = [mean([p[i] for p in rgb_pixels]) / 255.0 for i in range(3)]
-        rgb_stds = [std_dev([p[i] for p in rgb_pixels]) / 255.0 for i in range(3)]
+        # Every scalar below is derived from the per-channel value histograms
+        counts, channel_means, channel_stds = channel_statistics(image)
+        rgb_means = (channel_means / 255.0).tolist()
+        rgb_stds = (channel_stds / 255.0).tolist()
         features.extend(rgb_means + rgb_stds)
         
         # Color uniformity (4 features)
-        color_ranges = []
-        for channel in range(3):
-            channel_vals = [p[channel] for p in rgb_pixels]
-            color_ranges.append((max(channel_vals) - min(channel_vals)) / 255.0)
-        avg_color_range = mean(color_ranges)
+        present = counts > 0
+        color_ranges = (255 - present[:, ::-1].argmax(axis=1) - present.argmax(axis=1)) / 255.0
+        avg_color_range = float(color_ranges.mean())
         
-        # Brightness analysis
-        brightness_vals = [sum(p) / 3 for p in rgb_pixels]
-        brightness = mean(brightness_vals) / 255.0
-        contrast = std_dev(brightness_vals) / 255.0
+        # Brightness analysis (mean intensity is the mean of the channel means)
+        brightness = float(channel_means.mean()) / 255.0
+        contrast = float(gray.std()) / 255.0
         
         # Dominant color detection (simplified)
         dominant_channel = rgb_means.index(max(rgb_means))
@@ -467,21 +493,17 @@ def extract_visual_features_from_image(image: Image.Image) -> List[float]:
         
         # Local texture variance
         block_size = 16
-        local_variances = []
-        for y in range(0, height - block_size, block_size):
-            for x in range(0, width - block_size, block_size):
-                block_pixels = []
-                for by in range(y, min(y + block_size, height)):
-                    for bx in range(x, min(x + block_size, width)):
-                        pixel = rgb_pixels[by * width + bx]
-                        block_pixels.append(sum(pixel) / 3)
-                
-                if block_pixels:
-                    local_variances.append(std_dev(block_pixels))
-        
-        if local_variances:
-            texture_mean = mean(local_variances) / 255.0
-            texture_std = std_dev(local_variances) / 255.0
+        # Blocks start strictly before the last block_size pixels, as they always have
+        blocks_y = len(range(0, height - block_size, block_size))
+        blocks_x = len(range(0, width - block_size, block_size))
+        blocks = gray[:blocks_y * block_size, :blocks_x * block_size].reshape(
+            blocks_y, block_size, blocks_x, block_size
+        )
+        local_variances = blocks.std(axis=(1, 3)).ravel()
+        
+        if local_variances.size:
+            texture_mean = float(local_variances.mean()) / 255.0
+            texture_std = float(local_variances.std()) / 255.0
             texture_uniformity = 1.0 - (texture_std / max(texture_mean, 0.001))
         else:
             texture_mean = texture_std = 0.1
@@ -489,80 +511,73 @@ def extract_visual_features_from_image(image: Image.Image) -> List[float]:
         
         # Pattern regularity
         pattern_score = min(texture_uniformity, 1.0)
-        complexity_score = min(len(set(rgb_pixels)) / len(rgb_pixels), 1.0)
+        # Distinct colors, counted on RGB packed into one uint32 per pixel; an
+        # in-place sort and a count of value changes beat np.unique several-fold
+        color_codes = ((rgb[..., 0].astype(np.uint32) << 16) | (rgb[..., 1].astype(np.uint32) << 8) | rgb[..., 2]).ravel()
+        color_codes.sort()
+        distinct_colors = np.count_nonzero(color_codes[1:] != color_codes[:-1]) + 1
+        complexity_score = min(distinct_colors / color_codes.size, 1.0)
         
         features.extend([texture_mean, texture_std, texture_uniformity, pattern_score, complexity_score])
         
-        # Ensure exactly 50 dimensions
-        while len(features) < 50:
-            features.append(0.05)
+        # Ensure exactly 50 dimensions, padding with 0.05
+        embedding = np.full(50, 0.05, dtype=np.float32)
         features = features[:50]
+        embedding[:len(features)] = features
         
-        return features
+        return embedding
         
     except Exception as e:
+        if strict:
+            raise
         print(f"Error extracting visual features: {e}")
-        return [0.1] * 50
+        return np.full(50, 0.1, dtype=np.float32)
+
+def generate_query_embedding(image_data: Union[bytes, BinaryIO], strict: bool = False) -> np.ndarray:
+    """Generate visual embedding from uploaded image data or an open image file
 
-def generate_query_embedding(image_data: bytes) -> List[float]:
-    """Generate visual embedding from uploaded image data"""
+    Failures give the 0.1 fallback embedding, or raise when strict is set.
+    """
     try:
-        image = Image.open(io.BytesIO(image_data))
-        return extract_visual_features_from_image(image)
+        if isinstance(image_data, (bytes, bytearray)):
+            image_data = io.BytesIO(image_data)
+        image = Image.open(image_data)
+        return extract_visual_features_from_image(image, strict)
         
     except Exception as e:
+        if strict:
+            raise
         print(f"Error generating query embedding: {e}")
         # Return default embedding with 50 dimensions
-        return [0.1] * 50
+        return np.full(50, 0.1, dtype=np.float32)
 
-def calculate_enhanced_similarity(query_embedding: List[float], product_embedding: List[float]) -> float:
+def calculate_enhanced_similarity(query_embedding: np.ndarray, product_embedding: np.ndarray) -> float:
     """Calculate similarity prioritizing garment shape/structure over color - FIXED VERSION"""
     try:
         if len(query_embedding) != len(product_embedding) or len(query_embedding) != 50:
             return 0.0
         
-        # Define feature importance weights - HEAVILY prioritize shape over color
+        # Feature importance weights (FEATURE_GROUPS) HEAVILY prioritize shape over color
         # Feature structure (50 features total):
         # 0-16:  Garment Shape Analysis (17 features) - MAXIMUM IMPORTANCE
         # 17-31: Structural Pattern Analysis (15 features) - HIGH IMPORTANCE  
         # 32-41: Minimal Color Features (10 features) - LOW IMPORTANCE
         # 42-49: Texture & Padding (8 features) - MEDIUM TO LOW IMPORTANCE
         
-        # Calculate similarity for different feature groups separately
-        similarities = []
-        
-        # 1. SHAPE FEATURES (0-16) - MOST IMPORTANT - Weight 8.0
-        shape_features_q = query_embedding[0:17]
-        shape_features_p = product_embedding[0:17]
-        shape_similarity = calculate_cosine_similarity(shape_features_q, shape_features_p)
-        similarities.append((shape_similarity, 8.0))
-        
-        # 2. STRUCTURAL FEATURES (17-31) - HIGH IMPORTANCE - Weight 4.0
-        struct_features_q = query_embedding[17:32]
-        struct_features_p = product_embedding[17:32]
-        struct_similarity = calculate_cosine_similarity(struct_features_q, struct_features_p)
-        similarities.append((struct_similarity, 4.0))
-        
-        # 3. COLOR FEATURES (32-41) - LOW IMPORTANCE - Weight 0.5
-        color_features_q = query_embedding[32:42]
-        color_features_p = product_embedding[32:42]
-        color_similarity = calculate_cosine_similarity(color_features_q, color_features_p)
-        similarities.append((color_similarity, 0.5))
-        
-        # 4. TEXTURE FEATURES (42-49) - MEDIUM IMPORTANCE - Weight 2.0
-        texture_features_q = query_embedding[42:50]
-        texture_features_p = product_embedding[42:50]
-        texture_similarity = calculate_cosine_similarity(texture_features_q, texture_features_p)
-        similarities.append((texture_similarity, 2.0))
+        query_embedding = np.asarray(query_embedding, dtype=np.float64)
+        product_embedding = np.asarray(product_embedding, dtype=np.float64)
         
-        # Calculate weighted average
-        weighted_sum = sum(sim * weight for sim, weight in similarities)
-        total_weight = sum(weight for _, weight in similarities)
+        # Per-group dot products and squared norms, one reduction each
+        dots = np.add.reduceat(query_embedding * product_embedding, GROUP_STARTS)
+        query_norms = np.add.reduceat(query_embedding * query_embedding, GROUP_STARTS)
+        product_norms = np.add.reduceat(product_embedding * product_embedding, GROUP_STARTS)
         
-        if total_weight == 0:
-            return 0.0
+        # Per-group cosine similarity, 0 for groups with a zero vector
+        magnitudes = np.sqrt(query_norms * product_norms)
+        similarities = np.divide(dots, magnitudes, out=np.zeros_like(dots), where=magnitudes > 0)
         
-        final_similarity = weighted_sum / total_weight
+        # Calculate weighted average
+        final_similarity = float(similarities @ GROUP_WEIGHTS) / GROUP_WEIGHTS.sum()
         
         # Normalize to 0-1 range (cosine similarity can be negative)
         normalized_similarity = (final_similarity + 1.0) / 2.0
@@ -576,39 +591,105 @@ def calculate_enhanced_similarity(query_embedding: List[float], product_embeddin
         print(f"Error calculating enhanced similarity: {e}")
         return 0.0
 
+def normalize_embeddings(embeddings) -> np.ndarray:
+    """L2-normalize each feature group and scale it by sqrt(weight / total weight).
+
+    Rows produced this way have unit length, and the dot product of two of them
+    is the weighted mean of per-group cosines computed by
+    calculate_enhanced_similarity (before it is mapped to the 0-1 range).
+    """
+    matrix = np.array(embeddings, dtype=np.float32, ndmin=2)
+    total_weight = sum(weight for _, _, weight in FEATURE_GROUPS)
+
+    for start, end, weight in FEATURE_GROUPS:
+        block = matrix[:, start:end]
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        np.divide(block, norms, out=block, where=norms > 0)
+        block *= math.sqrt(weight / total_weight)
+
+    return matrix
+
+def rank_products(
+    query_embedding: np.ndarray,
+    embedding_matrix: np.ndarray,
+    min_similarity: float = 0.0,
+    max_results: int = 10
+) -> List[Tuple[int, float]]:
+    """Rank rows of a product embedding matrix, returning (row, similarity) pairs
+
+    The matrix rows must come from normalize_embeddings, so scoring every
+    product is a single matrix-vector product. Scores match
+    calculate_enhanced_similarity.
+    """
+
+    if len(query_embedding) != embedding_matrix.shape[1]:
+        return []
+
+    query = normalize_embeddings(query_embedding)[0]
+    scores = embedding_matrix @ query
+
+    # Same 0-1 mapping as calculate_enhanced_similarity
+    np.clip((scores + 1.0) / 2.0, 0.0, 1.0, out=scores)
+
+    # Rows without a usable embedding are NaN and never pass the threshold
+    candidates = np.flatnonzero(scores >= min_similarity)
+    if len(candidates) > max_results:
+        top = np.argpartition(-scores[candidates], max_results - 1)[:max_results]
+        candidates = np.sort(candidates[top])
+
+    candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+    return [(int(row), float(scores[row])) for row in candidates]
+
+# (products list, its length, usable products, normalized matrix) for the last
+# database searched, so repeated searches don't re-normalize every embedding
+_normalized_cache = None
+
+def _normalized_products(product_database: Dict) -> Tuple[List[Dict], np.ndarray]:
+    """Products with a usable embedding and their normalize_embeddings matrix"""
+    global _normalized_cache
+    all_products = product_database.get('products', [])
+    
+    cached = _normalized_cache
+    if cached is not None and cached[0] is all_products and cached[1] == len(all_products):
+        return cached[2], cached[3]
+    
+    dimension = FEATURE_GROUPS[-1][1]
+    products = [
+        product for product in all_products
+        if product.get('embedding') and len(product['embedding']) == dimension
+    ]
+    embedding_matrix = normalize_embeddings(
+        [product['embedding'] for product in products]
+    ) if products else np.empty((0, dimension), dtype=np.float32)
+    
+    _normalized_cache = (all_products, len(all_products), products, embedding_matrix)
+    return products, embedding_matrix
+
 def find_similar_products(
-    query_embedding: List[float], 
+    query_embedding: np.ndarray, 
     product_database: Dict, 
     min_similarity: float = 0.0,
     max_results: int = 10
 ) -> List[Dict]:
     """Find similar products using enhanced visual similarity"""
     
-    if not query_embedding:
+    if len(query_embedding) == 0:
         return []
     
-    products = product_database.get('products', [])
-    similarities = []
-    
-    # Calculate similarities
-    for product in products:
-        if 'embedding' in product and product['embedding']:
-            # Use enhanced similarity calculation
-            similarity = calculate_enhanced_similarity(query_embedding, product['embedding'])
-            
-            if similarity >= min_similarity:
-                result = {
-                    'product_id': product['product_id'],
-                    'product_name': product['product_name'],
-                    'category': product['category'],
-                    'image_path': product['image_path'],
-                    'similarity_score': similarity
-                }
-                similarities.append(result)
+    products, embedding_matrix = _normalized_products(product_database)
+    if not products:
+        return []
     
-    # Sort by similarity (descending) and return top results
-    similarities.sort(key=lambda x: x['similarity_score'], reverse=True)
-    return similarities[:max_results]
+    return [
+        {
+            'product_id': products[row]['product_id'],
+            'product_name': products[row]['product_name'],
+            'category': products[row]['category'],
+            'image_path': products[row]['image_path'],
+            'similarity_score': similarity
+        }
+        for row, similarity in rank_products(query_embedding, embedding_matrix, min_similarity, max_results)
+    ]
 
 def get_category_stats(product_database: Dict) -> Dict[str, int]:
     """Get statistics about categories in the database"""
@@ -14,15 +14,16 @@ def main():
         
         # Get port from environment or default
         port = int(os.environ.get("PORT", 8000))
+        workers = int(os.environ.get("WEB_CONCURRENCY", 1))
         
-        print(f"Starting server on port {port}")
+        print(f"Starting server on port {port} with {workers} worker(s)")
         
-        # Start uvicorn server
+        # Start uvicorn server (worker processes import the app by name)
         uvicorn.run(
-            app, 
+            app if workers == 1 else "main:app", 
             host="0.0.0.0", 
             port=port,
-            workers=1,
+            workers=workers,
             log_level="info",
             access_log=True
         )
@@ -8,7 +8,6 @@ import os
 import sys
 import json
 import logging
-from pathlib import Path
 
 # Setup logging
 logging.basicConfig(
@@ -29,10 +28,10 @@ def check_environment():
         "pinecone_service.py"
     ]
     
-    missing_files = []
-    for file in required_files:
-        if not Path(file).exists():
-            missing_files.append(file)
+    # One directory listing answers every existence check below
+    present_files = set(os.listdir("."))
+    
+    missing_files = [file for file in required_files if file not in present_files]
     
     if missing_files:
         logger.error(f"Missing required files: {missing_files}")
@@ -40,30 +39,24 @@ def check_environment():
     
     # Check for database
     db_files = ["product_database_deploy.json", "product_database.json"]
-    db_found = False
-    for db_file in db_files:
-        if Path(db_file).exists():
-            logger.info(f"Found database file: {db_file}")
-            db_found = True
-            break
+    db_file = next((db_file for db_file in db_files if db_file in present_files), None)
     
-    if not db_found:
+    if db_file is None:
         logger.error("No product database found!")
         return False
     
+    logger.info(f"Found database file: {db_file}")
+    
     # Check environment variables
-    env_vars = {
-        "PORT": os.getenv("PORT", "8000"),
-        "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY"),
-        "PINECONE_API_KEY": os.getenv("PINECONE_API_KEY")
-    }
+    def key_status(key):
+        return '✓ Set' if os.getenv(key) else '✗ Missing'
     
-    logger.info(f"Environment configuration:")
-    for key, value in env_vars.items():
-        if key.endswith("_KEY"):
-            logger.info(f"  {key}: {'✓ Set' if value else '✗ Missing'}")
-        else:
-            logger.info(f"  {key}: {value}")
+    logger.info(
+        "Environment configuration:\n"
+        f"  PORT: {os.getenv('PORT', '8000')}\n"
+        f"  GOOGLE_API_KEY: {key_status('GOOGLE_API_KEY')}\n"
+        f"  PINECONE_API_KEY: {key_status('PINECONE_API_KEY')}"
+    )
     
     return True
 
@@ -82,13 +75,16 @@ def main():
         
         port = int(os.getenv("PORT", 8000))
         host = os.getenv("HOST", "0.0.0.0")
+        workers = int(os.getenv("WEB_CONCURRENCY", "1"))
         
-        logger.info(f"Starting server on {host}:{port}")
+        logger.info(f"Starting server on {host}:{port} with {workers} worker(s)")
         
+        # Worker processes import the app themselves, so it has to be given by name
         uvicorn.run(
-            app, 
+            app if workers == 1 else "main:app", 
             host=host, 
             port=port,
+            workers=workers,
             log_level="info",
             access_log=True
         )
@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
 
 import pandas as pd
-import json
+import numpy as np
 import shutil
 import os
+import sys
 from pathlib import Path
 import random
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import math
 
+# Import the backend modules by the same top-level names the server uses
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend"))
+from product_store import dump_database
+
 # Configuration
 CSV_PATH = "/Users/kavya/Downloads/archive/Fashion Dataset.csv"
 IMAGES_SOURCE = "/Users/kavya/Downloads/archive/Images/Images"
@@ -16,6 +22,73 @@ IMAGES_DEST = "backend/images"
 TARGET_CATEGORIES = 50
 PRODUCTS_PER_CATEGORY = 8  # Aim for 8 products per category
 MAX_TOTAL_PRODUCTS = 400   # 50 categories * 8 products
+COPY_WORKERS = 16          # Parallel image copies
+
+# Name keywords (substring patterns) that add a category during analysis
+NAME_CATEGORIES = [
+    ('shirt', 'Shirts'),
+    ('dress', 'Dresses'),
+    ('skirt', 'Skirts'),
+    ('jacket', 'Jackets'),
+    ('blazer', 'Blazers'),
+    ('coat', 'Coats'),
+    ('sweater', 'Sweaters'),
+    ('cardigan', 'Cardigans'),
+    ('jumpsuit', 'Jumpsuits'),
+]
+
+# Categories matched by product name: category -> (assigned category, name pattern)
+CATEGORY_NAME_PATTERNS = {
+    'Kurta': ('Kurtas', 'kurta'),
+    'Kurtas': ('Kurtas', 'kurta'),
+    'Top': ('Tops', 'top|kurti'),
+    'Tops': ('Tops', 'top|kurti'),
+    'Shirts': ('Shirts', 'shirt'),
+    'Dresses': ('Dresses', 'dress'),
+    'Skirts': ('Skirts', 'skirt'),
+    'Jackets': ('Jackets', 'jacket'),
+    'Blazers': ('Blazers', 'blazer'),
+    'Trousers': ('Trousers', 'trouser|pant'),
+    'Palazzos': ('Palazzos', 'palazzo'),
+}
+
+# Embedding dimensions set by name/category keywords: (pattern, dimension),
+# first match wins
+COLOR_FEATURES = [  # dimensions 0-10
+    ('black', 0),
+    ('white', 1),
+    ('red', 2),
+    ('blue', 3),
+    ('green', 4),
+    ('pink', 5),
+    ('yellow', 6),
+    ('purple', 7),
+    ('orange', 8),
+    ('brown|beige', 9),
+]
+CATEGORY_FEATURES = [  # dimensions 10-25
+    ('kurta', 10),
+    ('top', 11),
+    ('shirt', 12),
+    ('dress', 13),
+    ('skirt', 14),
+    ('trouser', 15),
+    ('palazzo', 16),
+]
+PATTERN_FEATURES = [  # dimensions 25-35
+    ('floral', 25),
+    ('stripe', 26),
+    ('solid', 27),
+    ('print', 28),
+    ('embroidered', 29),
+]
+
+# Generic categories for products no category matched, in priority order
+FALLBACK_CATEGORIES = [
+    ('kurta', 'Kurtas'),
+    ('top|kurti', 'Tops'),
+    ('shirt', 'Shirts'),
+]
 
 def analyze_csv_categories():
     """Analyze the CSV to understand available categories and attributes"""
@@ -25,56 +98,19 @@ def analyze_csv_categories():
     df = pd.read_csv(CSV_PATH)
     print(f"Loaded {len(df)} products from CSV")
     
-    # Extract categories from p_attributes column
+    # Extract categories from p_attributes column (a dictionary-like string)
+    has_attributes = df['p_attributes'].notna()
+    attrs = df.loc[has_attributes, 'p_attributes'].astype(str)
+    names = df.loc[has_attributes, 'name'].astype(str).str.lower()
+    
     categories = set()
-    product_types = set()
+    for attribute in ('Top Type', 'Bottom Type'):
+        categories.update(attrs.str.extract(f"'{attribute}': '([^']+)'", expand=False).dropna())
     
-    for idx, row in df.iterrows():
-        if pd.isna(row['p_attributes']):
-            continue
-            
-        try:
-            # Parse the attributes string (it's like a dictionary string)
-            attrs_str = row['p_attributes']
-            if 'Top Type' in attrs_str:
-                # Extract Top Type
-                start = attrs_str.find("'Top Type': '") + len("'Top Type': '")
-                end = attrs_str.find("'", start)
-                if end > start:
-                    top_type = attrs_str[start:end]
-                    categories.add(top_type)
-            
-            if 'Bottom Type' in attrs_str:
-                # Extract Bottom Type  
-                start = attrs_str.find("'Bottom Type': '") + len("'Bottom Type': '")
-                end = attrs_str.find("'", start)
-                if end > start:
-                    bottom_type = attrs_str[start:end]
-                    categories.add(bottom_type)
-                    
-            # Also check for other clothing types in the name
-            name = str(row['name']).lower()
-            if 'shirt' in name and 'Shirts' not in categories:
-                categories.add('Shirts')
-            elif 'dress' in name and 'Dresses' not in categories:
-                categories.add('Dresses')
-            elif 'skirt' in name and 'Skirts' not in categories:
-                categories.add('Skirts')
-            elif 'jacket' in name and 'Jackets' not in categories:
-                categories.add('Jackets')
-            elif 'blazer' in name and 'Blazers' not in categories:
-                categories.add('Blazers')
-            elif 'coat' in name and 'Coats' not in categories:
-                categories.add('Coats')
-            elif 'sweater' in name and 'Sweaters' not in categories:
-                categories.add('Sweaters')
-            elif 'cardigan' in name and 'Cardigans' not in categories:
-                categories.add('Cardigans')
-            elif 'jumpsuit' in name and 'Jumpsuits' not in categories:
-                categories.add('Jumpsuits')
-                
-        except Exception as e:
-            continue
+    # Also check for other clothing types in the name
+    for keyword, category in NAME_CATEGORIES:
+        if names.str.contains(keyword, regex=False).any():
+            categories.add(category)
     
     categories = list(categories)[:TARGET_CATEGORIES]  # Limit to target number
     print(f"Found {len(categories)} unique categories:")
@@ -85,62 +121,32 @@ def analyze_csv_categories():
 
 def create_category_mapping(df, categories):
     """Create mapping of categories to product indices"""
-    category_products = defaultdict(list)
+    valid = df['p_attributes'].notna() & df['name'].notna()
+    attrs = df.loc[valid, 'p_attributes'].astype(str)
+    names = df.loc[valid, 'name'].astype(str).str.lower()
+    assigned = pd.Series(None, index=names.index, dtype=object)
     
-    for idx, row in df.iterrows():
-        if pd.isna(row['p_attributes']) or pd.isna(row['name']):
-            continue
-            
-        attrs_str = str(row['p_attributes'])
-        name = str(row['name']).lower()
-        assigned_category = None
-        
-        # Try to assign to a category
-        for category in categories:
-            if category in ['Kurta', 'Kurtas'] and 'kurta' in name:
-                assigned_category = 'Kurtas'
-                break
-            elif category in ['Tops', 'Top'] and ('top' in name or 'kurti' in name):
-                assigned_category = 'Tops'
-                break
-            elif category == 'Shirts' and 'shirt' in name:
-                assigned_category = 'Shirts'
-                break
-            elif category == 'Dresses' and 'dress' in name:
-                assigned_category = 'Dresses'
-                break
-            elif category == 'Skirts' and 'skirt' in name:
-                assigned_category = 'Skirts'
-                break
-            elif category == 'Jackets' and 'jacket' in name:
-                assigned_category = 'Jackets'
-                break
-            elif category == 'Blazers' and 'blazer' in name:
-                assigned_category = 'Blazers'
-                break
-            elif category == 'Trousers' and ('trouser' in name or 'pant' in name):
-                assigned_category = 'Trousers'
-                break
-            elif category == 'Palazzos' and 'palazzo' in name:
-                assigned_category = 'Palazzos'
-                break
-            elif f"'{category}'" in attrs_str:
-                assigned_category = category
-                break
-        
-        # If no category assigned, use a generic one based on name
-        if not assigned_category:
-            if 'kurta' in name:
-                assigned_category = 'Kurtas'
-            elif 'top' in name or 'kurti' in name:
-                assigned_category = 'Tops'
-            elif 'shirt' in name:
-                assigned_category = 'Shirts'
-            else:
-                assigned_category = 'Fashion'  # Generic category
-        
-        if assigned_category:
-            category_products[assigned_category].append(idx)
+    # Each product takes the first category (in list order) it matches by
+    # name, or else by appearing quoted in its attributes
+    for category in categories:
+        unassigned = assigned.isna()
+        by_attributes = unassigned & attrs.str.contains(f"'{category}'", regex=False)
+        if category in CATEGORY_NAME_PATTERNS:
+            name_category, pattern = CATEGORY_NAME_PATTERNS[category]
+            by_name = unassigned & names.str.contains(pattern)
+            assigned[by_name] = name_category
+            by_attributes &= ~by_name
+        assigned[by_attributes] = category
+    
+    # If no category assigned, use a generic one based on name
+    for pattern, category in FALLBACK_CATEGORIES:
+        assigned[assigned.isna() & names.str.contains(pattern)] = category
+    assigned = assigned.fillna('Fashion')  # Generic category
+    
+    # Product indices per category, categories in order of first appearance
+    category_products = defaultdict(list)
+    for category, products in assigned.groupby(assigned, sort=False):
+        category_products[category] = products.index.tolist()
     
     return category_products
 
@@ -177,8 +183,29 @@ def select_diverse_products(df, category_products, max_products=MAX_TOTAL_PRODUC
     print(f"Selected {len(selected_products)} products total")
     return selected_products
 
+def copy_product_image(i, product):
+    """Copy one product's source image to backend/images/{i}.jpg, returning whether it was copied"""
+    source_image = Path(IMAGES_SOURCE) / f"{product['source_image_index']}.jpg"
+    dest_image = Path(IMAGES_DEST) / f"{i}.jpg"
+    
+    if not source_image.exists():
+        print(f"Source image not found: {source_image}")
+        return False
+    
+    try:
+        # select_diverse_products already pointed image_path at this file
+        shutil.copy2(source_image, dest_image)
+        return True
+    except Exception as e:
+        print(f"Error copying {source_image}: {e}")
+        return False
+
 def copy_images(selected_products):
-    """Copy selected images to backend/images directory"""
+    """Copy selected images to backend/images directory
+    
+    Returns the products whose image was copied; the rest are left out of
+    the database rather than pointing at a missing image.
+    """
     print("Copying images to backend/images...")
     
     # Create destination directory
@@ -189,96 +216,50 @@ def copy_images(selected_products):
     for file in dest_dir.glob("*.jpg"):
         file.unlink()
     
-    copied_count = 0
+    # Copies are I/O bound, so threads overlap them despite the GIL
+    with ThreadPoolExecutor(max_workers=COPY_WORKERS) as executor:
+        copied = list(executor.map(copy_product_image, range(len(selected_products)), selected_products))
     
-    for i, product in enumerate(selected_products):
-        source_image = Path(IMAGES_SOURCE) / f"{product['source_image_index']}.jpg"
-        dest_image = dest_dir / f"{i}.jpg"
-        
-        if source_image.exists():
-            try:
-                shutil.copy2(source_image, dest_image)
-                # Update the product's image path to match the copied file
-                product['image_path'] = f"images/{i}.jpg"
-                copied_count += 1
-            except Exception as e:
-                print(f"Error copying {source_image}: {e}")
-                # Use a placeholder path
-                product['image_path'] = f"images/placeholder.jpg"
-        else:
-            print(f"Source image not found: {source_image}")
-            product['image_path'] = f"images/placeholder.jpg"
-    
-    print(f"Successfully copied {copied_count} images")
-    return copied_count
+    copied_products = [product for product, ok in zip(selected_products, copied) if ok]
+    print(f"Successfully copied {len(copied_products)} images")
+    return copied_products
+
+def keyword_feature_index(texts, keyword_features):
+    """Feature index of the first (pattern, index) each text matches, or -1 for none"""
+    feature_index = np.full(len(texts), -1)
+    # Later assignments win, so go in reverse to give earlier patterns priority
+    for pattern, index in reversed(keyword_features):
+        feature_index[texts.str.contains(pattern).to_numpy()] = index
+    return feature_index
 
 def generate_embeddings(selected_products):
     """Generate simple feature-based embeddings for products"""
     print("Generating embeddings...")
     
-    for product in selected_products:
-        # Create a simple embedding based on product features
-        embedding = [0.0] * 50  # 50-dimensional embedding
-        
-        # Name-based features for similarity
-        name = product['product_name'].lower()
-        
-        # Color features (first 10 dimensions)
-        if 'black' in name:
-            embedding[0] = 0.9
-        elif 'white' in name:
-            embedding[1] = 0.9
-        elif 'red' in name:
-            embedding[2] = 0.9
-        elif 'blue' in name:
-            embedding[3] = 0.9
-        elif 'green' in name:
-            embedding[4] = 0.9
-        elif 'pink' in name:
-            embedding[5] = 0.9
-        elif 'yellow' in name:
-            embedding[6] = 0.9
-        elif 'purple' in name:
-            embedding[7] = 0.9
-        elif 'orange' in name:
-            embedding[8] = 0.9
-        elif 'brown' in name or 'beige' in name:
-            embedding[9] = 0.9
-        
-        # Category features (dimensions 10-25)
-        category = product['category'].lower()
-        if 'kurta' in category:
-            embedding[10] = 0.8
-        elif 'top' in category:
-            embedding[11] = 0.8
-        elif 'shirt' in category:
-            embedding[12] = 0.8
-        elif 'dress' in category:
-            embedding[13] = 0.8
-        elif 'skirt' in category:
-            embedding[14] = 0.8
-        elif 'trouser' in category:
-            embedding[15] = 0.8
-        elif 'palazzo' in category:
-            embedding[16] = 0.8
-        
-        # Pattern features (dimensions 25-35)
-        if 'floral' in name:
-            embedding[25] = 0.7
-        elif 'stripe' in name:
-            embedding[26] = 0.7
-        elif 'solid' in name:
-            embedding[27] = 0.7
-        elif 'print' in name:
-            embedding[28] = 0.7
-        elif 'embroidered' in name:
-            embedding[29] = 0.7
-        
-        # Random features for diversity (dimensions 35-50)
-        for i in range(35, 50):
-            embedding[i] = random.random() * 0.5
-        
-        product['embedding'] = embedding
+    # One 50-dimensional embedding per row
+    embeddings = np.zeros((len(selected_products), 50))
+    
+    # Name-based features for similarity
+    names = pd.Series([product['product_name'] for product in selected_products], dtype=str).str.lower()
+    categories = pd.Series([product['category'] for product in selected_products], dtype=str).str.lower()
+    
+    rows = np.arange(len(selected_products))
+    for texts, keyword_features, value in [
+        (names, COLOR_FEATURES, 0.9),
+        (categories, CATEGORY_FEATURES, 0.8),
+        (names, PATTERN_FEATURES, 0.7),
+    ]:
+        feature_index = keyword_feature_index(texts, keyword_features)
+        matched = feature_index >= 0
+        embeddings[rows[matched], feature_index[matched]] = value
+    
+    # Random features for diversity (dimensions 35-50), drawn in one call;
+    # seeded from random so random.seed(42) in main still fixes them
+    rng = np.random.default_rng(random.getrandbits(64))
+    embeddings[:, 35:50] = rng.random((len(selected_products), 15)) * 0.5
+    
+    for embedding, product in zip(embeddings, selected_products):
+        product['embedding'] = embedding.tolist()
     
     return selected_products
 
@@ -334,8 +315,9 @@ def main():
     random.seed(42)  # For reproducible results
     selected_products = select_diverse_products(df, category_products)
     
-    # Step 4: Copy images
-    copied_count = copy_images(selected_products)
+    # Step 4: Copy images, dropping products without one
+    selected_products = copy_images(selected_products)
+    copied_count = len(selected_products)
     
     # Step 5: Generate embeddings
     selected_products = generate_embeddings(selected_products)
@@ -345,8 +327,8 @@ def main():
     
     # Save database
     output_path = "backend/product_database_deploy.json"
-    with open(output_path, 'w') as f:
-        json.dump(database, f, indent=2)
+    with open(output_path, 'wb') as f:
+        f.write(dump_database(database))
     
     print(f"\n✅ Created diverse database with:")
     print(f"   • {len(selected_products)} products")
@@ -278,7 +278,10 @@ function createProductCard(product) {
     card.className = 'product-card';
     
     const similarity = (product.similarity_score * 100).toFixed(1);
-    const imageUrl = `${API_BASE_URL}/${product.image_path}`;
+    // image_path is already an absolute URL when the backend serves images from a CDN
+    const imageUrl = /^https?:\/\//.test(product.image_path)
+        ? product.image_path
+        : `${API_BASE_URL}/${product.image_path}`;
     
     card.innerHTML = `
         <div class="product-image-container">
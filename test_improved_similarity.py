@@ -3,9 +3,12 @@
 import json
 import sys
 from pathlib import Path
-from backend.similarity import extract_visual_features_from_image, calculate_enhanced_similarity
 from PIL import Image
 
+# Import the backend modules by the same top-level names the server uses
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend"))
+from similarity import extract_visual_features_from_image, normalize_embeddings, rank_products
+
 def test_similarity_system():
     """Test the improved similarity system to ensure proper garment type matching"""
     
@@ -38,6 +41,9 @@ def test_similarity_system():
     # Test similarity within and across categories
     print("\nTesting Similarity Matching...")
     
+    # Normalize every product once; each test is then a single matrix-vector product
+    embedding_matrix = normalize_embeddings([product['embedding'] for product in products])
+    
     for test_category, test_products in test_cases.items():
         if len(test_products) < 1:
             continue
@@ -47,20 +53,16 @@ def test_similarity_system():
         
         print(f"\n--- Testing {test_category}: {test_product['product_name'][:50]}... ---")
         
-        similarities = []
-        for product in products:
-            if product['product_id'] == test_product['product_id']:
-                continue
-                
-            similarity = calculate_enhanced_similarity(test_embedding, product['embedding'])
-            similarities.append({
-                'category': product['category'],
-                'name': product['product_name'][:30] + "...",
+        # Ranked by similarity (descending)
+        similarities = [
+            {
+                'category': products[row]['category'],
+                'name': products[row]['product_name'][:30] + "...",
                 'similarity': similarity
-            })
-        
-        # Sort by similarity
-        similarities.sort(key=lambda x: x['similarity'], reverse=True)
+            }
+            for row, similarity in rank_products(test_embedding, embedding_matrix, max_results=len(products))
+            if products[row]['product_id'] != test_product['product_id']
+        ]
         
         # Show top 10 matches
         print("Top 10 Similar Products:")
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+import asyncio
+import sys
+from pathlib import Path
+import numpy as np
+from PIL import Image
+
+# Import the backend modules by the same top-level names the server uses
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend"))
+import similarity
+from similarity import calculate_enhanced_similarity, normalize_embeddings, rank_products
+from kernels import quantize_int8, topk_filter, topk_filter_batch
+from ann_index import CentroidIndex, FAISS_AVAILABLE, build_index
+from batcher import MicroBatcher
+
+def test_rank_products():
+    """rank_products scores every product like calculate_enhanced_similarity"""
+
+    print("Testing vectorized product ranking...")
+
+    rng = np.random.default_rng(0)
+    embeddings = rng.random((500, 50))
+    query = rng.random(50)
+    matrix = normalize_embeddings(embeddings)
+    pairwise = np.array([calculate_enhanced_similarity(query.tolist(), e.tolist()) for e in embeddings])
+
+    for min_similarity, max_results in [(0.0, 10), (0.0, 500), (float(np.median(pairwise)), 400)]:
+        ranked = rank_products(query.tolist(), matrix, min_similarity, max_results)
+        rows = np.array([row for row, _ in ranked], dtype=np.int64)
+        scores = np.array([score for _, score in ranked])
+        expected = [row for row in np.argsort(-pairwise, kind="stable") if pairwise[row] >= min_similarity][:max_results]
+
+        assert len(rows) == len(expected), f"{len(rows)} results, expected {len(expected)}"
+        assert np.allclose(scores, pairwise[rows], atol=1e-5), "scores differ from calculate_enhanced_similarity"
+        assert np.allclose(scores, pairwise[expected], atol=1e-5), "ranking differs from a full sort"
+
+    print("   Matrix ranking matches the pairwise similarity")
+
+def reference_topk(emb, query, k, thr, row_scale=None):
+    """Top-k by sorting every score in float64: (rows, their scores, all scores)"""
+    if row_scale is None:
+        dots = emb.astype(np.float64) @ query.astype(np.float64)
+    else:
+        q8, q_scale = quantize_int8(query)
+        dots = (emb.astype(np.float64) @ q8[0].astype(np.float64)) * row_scale * q_scale[0]
+    scores = np.clip((dots + 1.0) / 2.0, 0.0, 1.0)
+    rows = [row for row in np.argsort(-scores, kind="stable") if scores[row] >= thr][:k]
+    return np.array(rows, dtype=np.int64), scores[rows], scores
+
+def random_catalog(n=3000, seed=0):
+    """Weighted, normalized embeddings like the product cache, with some missing rows"""
+    rng = np.random.default_rng(seed)
+    emb = normalize_embeddings(rng.random((n, 50), dtype=np.float32))
+    emb[rng.choice(n, n // 50, replace=False)] = np.nan
+    queries = normalize_embeddings(rng.random((8, 50), dtype=np.float32))
+    return emb, queries
+
+def assert_same_ranking(found, expected, label):
+    """Same scores in the same order, each the found row's true score
+
+    Rows may only differ from the reference where scores tie to within
+    float32 rounding.
+    """
+    rows, scores = found
+    expected_rows, expected_scores, all_scores = expected
+    assert len(rows) == len(expected_rows), f"{label}: {len(rows)} results, expected {len(expected_rows)}"
+    assert len(np.unique(rows)) == len(rows), f"{label}: duplicate rows"
+    assert np.allclose(scores, expected_scores, atol=1e-5), f"{label}: scores differ"
+    assert np.allclose(all_scores[rows], scores, atol=1e-5), f"{label}: rows differ"
+
+def test_topk_kernels():
+    """topk_filter and topk_filter_batch match a full sort, in float32 and int8"""
+
+    print("Testing top-k ranking kernels...")
+
+    emb, queries = random_catalog()
+    emb_q8, emb_scale = quantize_int8(emb)
+    ks = [1, 5, 10, 50, 3000, 0, 10, 20]
+    thrs = [0.0, 0.5, 0.9, 0.0, 0.0, 0.0, 1.01, 0.95]
+
+    for i, (query, k, thr) in enumerate(zip(queries, ks, thrs)):
+        expected = reference_topk(emb, query, k, thr)
+        assert_same_ranking(topk_filter(emb, query, k, thr), expected, f"float32 query {i}")
+
+        expected_q8 = reference_topk(emb_q8, query, k, thr, emb_scale)
+        assert_same_ranking(topk_filter(emb_q8, query, k, thr, emb_scale), expected_q8, f"int8 query {i}")
+
+    # Rows without an embedding are NaN and never returned
+    missing = np.flatnonzero(np.isnan(emb[:, 0]))
+    rows, _ = topk_filter(emb, queries[0], len(emb), 0.0)
+    assert not np.isin(rows, missing).any(), "NaN rows were returned"
+
+    for i, (found, query, k, thr) in enumerate(zip(topk_filter_batch(emb, queries, ks, thrs), queries, ks, thrs)):
+        assert_same_ranking(found, reference_topk(emb, query, k, thr), f"batch query {i}")
+
+    batch_q8 = topk_filter_batch(emb_q8, queries, ks, thrs, row_scale=emb_scale)
+    for i, (found, query, k, thr) in enumerate(zip(batch_q8, queries, ks, thrs)):
+        assert_same_ranking(found, reference_topk(emb_q8, query, k, thr, emb_scale), f"int8 batch query {i}")
+
+    print("   Top-k kernels match the reference ranking")
+
+def test_quantize_int8():
+    """int8 rows reconstruct their input within one quantization step"""
+
+    print("Testing int8 quantization...")
+
+    emb, _ = random_catalog()
+    q, scale = quantize_int8(emb)
+    usable = ~np.isnan(emb[:, 0])
+
+    assert q.dtype == np.int8 and scale.dtype == np.float32
+    assert np.isnan(scale[~usable]).all(), "missing rows should get a NaN scale"
+    error = np.abs(q[usable] * scale[usable, None] - emb[usable])
+    assert (error <= scale[usable, None] / 2 + 1e-7).all(), "int8 rows off by more than half a step"
+
+    zero_q, zero_scale = quantize_int8(np.zeros((1, 50), dtype=np.float32))
+    assert not zero_q.any() and zero_scale[0] == 0
+
+    print("   Quantization error is within half a step")
+
+def test_centroid_index():
+    """Probing every category gives the brute-force results"""
+
+    print("Testing category centroid prefilter...")
+
+    emb, queries = random_catalog()
+    categories = np.array([f"cat{row % 12}" for row in range(len(emb))])
+    ks = [10] * len(queries)
+    thrs = [0.0] * len(queries)
+
+    exhaustive = CentroidIndex(emb, categories, probes=12)
+    for i, (found, query) in enumerate(zip(exhaustive.search(queries, ks, thrs), queries)):
+        assert_same_ranking(found, reference_topk(emb, query, 10, 0.0), f"centroid query {i}")
+
+    # With fewer probes, results only come from the probed categories' rows
+    partial = CentroidIndex(emb, categories, probes=3)
+    for query, (rows, scores) in zip(queries, partial.search(queries, ks, thrs)):
+        assert len(np.unique(categories[rows])) <= 3
+        exact = np.clip((emb[rows] @ query + 1.0) / 2.0, 0.0, 1.0)
+        assert np.allclose(scores, exact, atol=1e-5)
+
+    print(f"   {exhaustive}: probing every category matches brute force")
+
+def test_ann_index():
+    """HNSW results are scored like brute force and find each product itself"""
+
+    if not FAISS_AVAILABLE:
+        print("FAISS not installed, skipping HNSW index test")
+        return
+
+    print("Testing HNSW index...")
+
+    emb, _ = random_catalog()
+    ann = build_index(emb)
+    usable = np.flatnonzero(~np.isnan(emb[:, 0]))
+    queries = emb[usable[:20]]
+
+    for product_row, query, (rows, scores) in zip(usable, queries, ann.search(queries, [5] * 20, [0.0] * 20)):
+        assert rows[0] == product_row, "a product should be its own nearest neighbour"
+        exact = np.clip((emb[rows] @ query + 1.0) / 2.0, 0.0, 1.0)
+        assert np.allclose(scores, exact, atol=1e-5)
+
+    print("   HNSW scores match brute force")
+
+def test_micro_batcher():
+    """Queries ranked together through MicroBatcher get their own results"""
+
+    print("Testing micro-batched ranking...")
+
+    emb, queries = random_catalog()
+    batch_sizes = []
+
+    def rank_batch(items):
+        batch_sizes.append(len(items))
+        vectors, ks, thrs = zip(*items)
+        return topk_filter_batch(emb, np.stack(vectors), ks, thrs)
+
+    async def search_all():
+        batcher = MicroBatcher(rank_batch, max_batch=4, max_delay=0.05)
+        batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.submit((query, 10, 0.0)) for query in queries))
+        finally:
+            await batcher.stop()
+
+    for i, (found, query) in enumerate(zip(asyncio.run(search_all()), queries)):
+        assert_same_ranking(found, reference_topk(emb, query, 10, 0.0), f"batched query {i}")
+    assert max(batch_sizes) > 1 and max(batch_sizes) <= 4, f"unexpected batch sizes {batch_sizes}"
+
+    print(f"   {len(queries)} queries ranked in batches of {batch_sizes}")
+
+def scan_test_images():
+    """Random images of awkward sizes plus a few catalog thumbnails, read-only like np.asarray(image)"""
+    rng = np.random.default_rng(1)
+    images = [rng.integers(0, 256, size=(h, w, 3), dtype=np.uint8)
+              for h, w in [(1, 1), (1, 7), (2, 3), (3, 3), (5, 16), (37, 29), (224, 149)]]
+    for image_path in sorted(Path("backend/images").glob("*.jpg"))[:10]:
+        image = Image.open(image_path)
+        image.thumbnail((224, 224), Image.Resampling.LANCZOS)
+        images.append(np.asarray(image.convert('RGB')))
+    for rgb in images:
+        rgb.flags.writeable = False
+    return images
+
+def test_scan_image_paths():
+    """The Numba image scan matches the NumPy fallback, and so do the features"""
+
+    if not similarity.NUMBA_AVAILABLE:
+        print("Numba not installed, skipping image scan parity test")
+        return
+
+    print("Testing Numba image scan against the NumPy fallback...")
+
+    images = scan_test_images()
+    for rgb in images:
+        gray, edge_counts, profile, edges = similarity._scan_image(rgb)
+        expected_gray, expected_counts, expected_profile, expected_edges = similarity._scan_image_numpy(rgb)
+        label = f"{rgb.shape[0]}x{rgb.shape[1]} image"
+
+        # profile is (row_widths, half_sums, half_counts, region_sums, region_counts, moments)
+        counts = edge_counts + (profile[0], profile[2], profile[4]) + edges[1:]
+        expected_counts = expected_counts + (expected_profile[0], expected_profile[2], expected_profile[4]) + expected_edges[1:]
+        sums = (profile[1], profile[3], profile[5])
+        expected_sums = (expected_profile[1], expected_profile[3], expected_profile[5])
+
+        # Intensities, counts and gradient magnitudes are computed identically
+        assert np.array_equal(gray, expected_gray), f"{label}: intensity differs"
+        assert np.array_equal(edges[0], expected_edges[0]), f"{label}: edge responses differ"
+        for found, expected in zip(counts, expected_counts):
+            assert np.array_equal(found, expected), f"{label}: counts differ"
+
+        # Intensity sums only differ by summation order
+        for found, expected in zip(sums, expected_sums):
+            assert np.allclose(found, expected, rtol=1e-12, atol=0), f"{label}: intensity sums differ"
+
+    # End to end, both paths give the same 50 features
+    for rgb in images[-10:]:
+        features = similarity.extract_visual_features_from_image(Image.fromarray(rgb))
+        similarity.NUMBA_AVAILABLE = False
+        try:
+            expected = similarity.extract_visual_features_from_image(Image.fromarray(rgb))
+        finally:
+            similarity.NUMBA_AVAILABLE = True
+        assert np.allclose(features, expected, rtol=1e-6, atol=1e-7), "features differ between scan paths"
+
+    print(f"   {len(images)} images scan alike on both paths")
+
+if __name__ == "__main__":
+    test_rank_products()
+    test_topk_kernels()
+    test_quantize_int8()
+    test_centroid_index()
+    test_ann_index()
+    test_micro_batcher()
+    test_scan_image_paths()
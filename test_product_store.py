@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+import numpy as np
+
+# Import the backend modules by the same top-level names the server uses
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend"))
+from similarity import normalize_embeddings
+from product_store import cache_dir_for, is_cache_fresh, load_product_store
+from embedding_cache import QueryEmbeddingCache, SemanticResultCache, image_key
+
+def write_database(db_path, count, seed):
+    """Small product database; the last product has no embedding"""
+    rng = np.random.default_rng(seed)
+    products = [
+        {
+            'product_id': f"{seed}-{i}",
+            'product_name': f"Product {i}",
+            'category': ['Shirts', 'Dresses', 'Skirts'][i % 3],
+            'image_path': f"images/{i}.jpg",
+            'embedding': rng.random(50).tolist() if i < count - 1 else []
+        }
+        for i in range(count)
+    ]
+    Path(db_path).write_text(json.dumps({'metadata': {}, 'products': products}))
+    return products
+
+def test_soa_cache():
+    """The .npy cache matches the JSON and is rebuilt whenever it goes stale"""
+
+    print("Testing columnar product cache...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "products.json"
+        cache_dir = cache_dir_for(db_path)
+
+        products = write_database(db_path, 6, seed=1)
+        assert not is_cache_fresh(db_path), "no cache yet"
+
+        store = load_product_store(db_path)
+        assert is_cache_fresh(db_path), "cache should be fresh after a load"
+        assert len(store) == 6 and store.ids.tolist() == [p['product_id'] for p in products]
+        assert store.get("1-2") == {
+            'product_id': "1-2", 'product_name': "Product 2", 'category': "Skirts", 'image_path': "images/2.jpg"
+        }
+        expected = normalize_embeddings([p['embedding'] for p in products[:-1]])
+        assert np.allclose(store.emb[:-1], expected), "cached embeddings are not normalized rows"
+        assert np.isnan(store.emb[-1]).all(), "a product without an embedding should be a NaN row"
+
+        # A newer JSON makes the cache stale, and the next load picks up the new products
+        products = write_database(db_path, 4, seed=2)
+        past = db_path.stat().st_mtime - 10
+        os.utime(cache_dir / "emb.npy", (past, past))
+        assert not is_cache_fresh(db_path), "cache older than the JSON should be stale"
+
+        store = load_product_store(db_path)
+        assert is_cache_fresh(db_path)
+        assert store.ids.tolist() == [p['product_id'] for p in products], "stale cache was served"
+
+        # A cache with any array missing (e.g. an interrupted build) is rebuilt
+        (cache_dir / "cats.npy").unlink()
+        assert not is_cache_fresh(db_path), "incomplete cache should be stale"
+        store = load_product_store(db_path)
+        assert store.cats.tolist() == [p['category'] for p in products]
+
+        # Image paths can be rewritten to a CDN
+        store = load_product_store(db_path, image_base="https://cdn.example.com/img/")
+        assert store.get("2-1")['image_path'] == "https://cdn.example.com/img/1.jpg"
+
+    print("   Cache is rebuilt when stale and matches the JSON")
+
+def test_query_caches():
+    """Query embeddings are reused per image, and results per nearby query"""
+
+    print("Testing query caches...")
+
+    calls = []
+    def compute(image_data):
+        calls.append(image_data)
+        return np.full(50, len(calls), dtype=np.float32)
+
+    cache = QueryEmbeddingCache(maxsize=2)
+    for image_data in [b"a", b"b", b"a", b"c", b"b"]:
+        cache.get_or_compute(image_key(image_data), image_data, compute)
+    # b"b" was evicted by b"c" after b"a" was used again
+    assert calls == [b"a", b"b", b"c", b"b"], f"unexpected computations {calls}"
+    assert cache.stats() == {"hits": 1, "misses": 4, "size": 2, "maxsize": 2}
+
+    disabled = SemanticResultCache()
+    query = normalize_embeddings(np.arange(1, 51, dtype=np.float32))[0]
+    disabled.store(query, (0.0, 5), ["result"])
+    assert disabled.lookup(query, (0.0, 5)) is None, "disabled cache returned results"
+
+    results = SemanticResultCache(threshold=0.999, capacity=2)
+    results.store(query, (0.0, 5), ["result"])
+    assert results.lookup(query, (0.0, 5)) == ["result"]
+    assert results.lookup(query, (0.5, 5)) is None, "results reused for different search parameters"
+    other = normalize_embeddings(np.arange(50, 0, -1, dtype=np.float32))[0]
+    assert results.lookup(other, (0.0, 5)) is None, "results reused for a dissimilar query"
+
+    # The ring buffer overwrites the oldest entry
+    results.store(other, (0.0, 5), ["other"])
+    results.store(other, (0.0, 10), ["other, 10"])
+    assert results.lookup(query, (0.0, 5)) is None, "oldest entry should have been overwritten"
+
+    print("   Caches hit, miss and evict as expected")
+
+if __name__ == "__main__":
+    test_soa_cache()
+    test_query_caches()
@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 
 import json
+import sys
 from pathlib import Path
-from backend.similarity import generate_query_embedding, find_similar_products
+
+# Import the backend modules by the same top-level names the server uses
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend"))
+from similarity import generate_query_embedding, find_similar_products
 
 def test_similarity_matching():
     """Test that visual similarity matching works correctly"""
@@ -44,7 +48,7 @@ def test_similarity_matching():
         
         query_embedding = generate_query_embedding(image_data)
         
-        if not query_embedding:
+        if len(query_embedding) == 0:
             print("   Failed to generate embedding")
             continue
         